@@ -1,5 +1,5 @@
 import sys
-from src.redset import Redset
+from src.redset import Redset, REDSET_VARIANTS
 from src.user_stats import UserStats
 from src.redbench import Redbench
 from src.utils import get_experiment_db
@@ -32,7 +32,38 @@ def get_args():
         "-o",
         "--override",
         action="store_true",
-        help="Enable this flag to override existing data, i.e. rerun the generation pipeline.",
+        help="Enable this flag to override existing data, i.e. rerun the generation pipeline. Without it, only the steps whose inputs changed (see workloads/manifest.json) are rerun.",
+    )
+    parser.add_argument(
+        "-r",
+        "--redset",
+        type=str,
+        default="provisioned",
+        help=f"The Redset variant ({', '.join(REDSET_VARIANTS)}), or a Parquet file, a directory of Parquet files, or a glob, e.g. a local mirror (default: provisioned).",
+    )
+    parser.add_argument(
+        "--num_partitions",
+        type=int,
+        default=None,
+        help="Partition Redset by cluster into this many partitions, and preprocess them on a pool of processes (default: no partitioning).",
+    )
+    parser.add_argument(
+        "--memory_limit",
+        type=str,
+        default=None,
+        help="Memory limit of the experiment database, e.g. 4GB; DuckDB spills to disk beyond it (default: 80%% of the RAM).",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Number of threads of the experiment database (default: number of cores).",
+    )
+    parser.add_argument(
+        "--temp_directory",
+        type=str,
+        default=None,
+        help="Directory DuckDB spills to (default: db.duckdb.tmp/).",
     )
     args = parser.parse_args()
 
@@ -48,7 +79,11 @@ if __name__ == "__main__":
     args = get_args()
 
     # (Create and) connect to the experiment database
-    db = get_experiment_db()
+    db = get_experiment_db(
+        memory_limit=args.memory_limit,
+        threads=args.threads,
+        temp_directory=args.temp_directory,
+    )
 
     # Download IMDb
     setup_imdb_db(args.duckdb_cli)
@@ -64,14 +99,18 @@ if __name__ == "__main__":
     imdb_benchmarks.dump_plots()
 
     # Download, prefilter, and compute user stats for Redset
-    redset = Redset(db)
+    redset = Redset(
+        db,
+        source=REDSET_VARIANTS.get(args.redset, args.redset),
+        num_partitions=args.num_partitions,
+    )
     redset.setup(override=args.override)
     redset.compute_stats(override=args.override)
     redset.dump_plots()
 
     # Generate RedBench
     redbench = Redbench(imdb_benchmarks, db)
-    redbench.generate()
+    redbench.generate(override=args.override)
 
     # Unpack Redbench workloads
-    unpack_workloads()
+    unpack_workloads(override=args.override)
@@ -1,11 +1,19 @@
 import os
 import sys
+import duckdb
 from src.utils import *
-from src.redbench import WORKLOADS_DIR
+from src.runner import Runner, get_workloads
+from src.engines import (
+    ENGINES,
+    EVICTION_POLICIES,
+    CachingEngine,
+    ResultCache,
+    get_engine,
+)
+from src.engines.sqlite_engine import DEFAULT_SQLITE_DB_FILEPATH
 from src.benchmarks.imdb import setup_imdb_db
 from prettytable import PrettyTable
 from datetime import timedelta
-import time
 import argparse
 
 
@@ -22,57 +30,609 @@ def parse_args():
         default=DEFAULT_DUCKDB_CLI,
         help=f"DuckDB binary (default: {DEFAULT_DUCKDB_CLI}).",
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=list(ENGINES),
+        default="duckdb",
+        help="The system to run Redbench on: in-process DuckDB, the DuckDB binary, SQLite, or any DB-API driver (default: duckdb).",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default=None,
+        help=f"Database file holding IMDb (default: {IMDB_DB_FILEPATH}, {DEFAULT_SQLITE_DB_FILEPATH} for sqlite).",
+    )
+    parser.add_argument(
+        "--driver",
+        type=str,
+        default=None,
+        help='DB-API driver module for the dbapi engine, e.g. "psycopg2".',
+    )
+    parser.add_argument(
+        "--dsn",
+        type=str,
+        default=None,
+        help='Connection string passed to the DB-API driver, e.g. "dbname=imdb".',
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=RESULTS_DB_FILEPATH,
+        help=f"DuckDB file to store the per-query results in (default: {RESULTS_DB_FILEPATH}).",
+    )
+    parser.add_argument(
+        "--parquet",
+        type=str,
+        default=None,
+        help="Additionally export the per-query results to this Parquet file.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Interrupt queries running longer than this many seconds. Timed out and failed queries are recorded with their error message and the run continues (default: no timeout).",
+    )
+    parser.add_argument(
+        "--sample_interval",
+        type=float,
+        default=None,
+        help="Sample the CPU time, memory, and I/O of the engine every this many seconds (and at every query start) into the table resource_samples, e.g. 0.1.",
+    )
+    parser.add_argument(
+        "--prepare",
+        action="store_true",
+        help="Prepare every query file once per session and reuse its plan on repeats (DuckDB engines only). Reports planning and execution time separately.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Capture the operator profile of every query (DuckDB engines only) into the table operator_profiles.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        choices=EVICTION_POLICIES,
+        default=None,
+        help="Put a result cache with this eviction policy in front of the engine, as a baseline for exploiting query repetition (default: no cache).",
+    )
+    parser.add_argument(
+        "--cache_entries",
+        type=int,
+        default=None,
+        help="Maximum number of cached results (default: unbounded).",
+    )
+    parser.add_argument(
+        "--cache_bytes",
+        type=int,
+        default=None,
+        help="Maximum total size of the cached results in bytes (default: unbounded).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workloads",
+        type=str,
+        nargs="+",
+        default=None,
+        help='Only run these workloads, given as "<bucket>/<workload_type>", e.g. "90%%-100%%/high_variability" (default: all).',
+    )
+    # Single sequential runs are the default mode
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "-c",
+        "--concurrent",
+        action="store_true",
+        help="Replay the workloads concurrently, one client stream per workload, instead of one after another.",
+    )
+    parser.add_argument(
+        "-r",
+        "--repetitions",
+        type=int,
+        default=1,
+        help="Number of measured runs of the workloads (default: 1).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=0,
+        help="Number of discarded warmup runs before the measured runs (default: 0).",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["warm", "cold"],
+        default="warm",
+        help="warm: all runs share one session. cold: every run starts a fresh process after evicting imdb/db.duckdb from the OS page cache (default: warm).",
+    )
+    parser.add_argument(
+        "--target_ci_width",
+        type=float,
+        default=None,
+        help="Keep repeating until the 95%% bootstrap CI of every median is at most this wide relative to the median, e.g. 0.05.",
+    )
+    parser.add_argument(
+        "--max_repetitions",
+        type=int,
+        default=30,
+        help="Upper bound on the number of runs with --target_ci_width (default: 30).",
+    )
+    modes.add_argument(
+        "--open_loop",
+        action="store_true",
+        help="Replay every workload open-loop, submitting each query at its (compressed) Redset arrival time.",
+    )
+    parser.add_argument(
+        "--time_compression",
+        type=float,
+        default=1000,
+        help="Factor by which Redset inter-arrival times are divided in open-loop mode (default: 1000).",
+    )
+    parser.add_argument(
+        "--copies",
+        type=int,
+        default=1,
+        help="Number of concurrent streams per workload in concurrent mode (default: 1).",
+    )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=None,
+        help="Number of concurrent clients in concurrent mode (default: one per stream) or open-loop mode (default: one per core).",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Use a process pool instead of a thread pool in concurrent mode.",
+    )
     args = parser.parse_args()
+    # Repeated runs are sequential, and chosen by any of their flags
+    args.trials = (
+        args.repetitions > 1
+        or args.warmup > 0
+        or args.mode == "cold"
+        or args.target_ci_width is not None
+    )
+    if args.trials and (args.concurrent or args.open_loop):
+        parser.error(
+            "-r/--repetitions, --warmup, --mode cold, and --target_ci_width can't be combined with --concurrent or --open_loop."
+        )
+    is_sequential = not (args.trials or args.concurrent or args.open_loop)
+    for flag, is_set, is_supported, supported_modes in [
+        ("--profile", args.profile, is_sequential, "single sequential runs"),
+        ("--prepare", args.prepare, is_sequential, "single sequential runs"),
+        ("--sample_interval", args.sample_interval is not None, is_sequential, "single sequential runs"),
+        ("--parquet", args.parquet is not None, is_sequential, "single sequential runs"),
+        ("--copies", args.copies != 1, args.concurrent, "--concurrent"),
+        ("--processes", args.processes, args.concurrent, "--concurrent"),
+        ("--pool_size", args.pool_size is not None, args.concurrent or args.open_loop, "--concurrent and --open_loop"),
+    ]:
+        if is_set and not is_supported:
+            parser.error(f"{flag} is only supported by {supported_modes}.")
+    if args.engine == "dbapi" and (args.driver is None or args.dsn is None):
+        parser.error("The dbapi engine requires --driver and --dsn.")
+    # Capabilities of the engine's adapter (see src/engines/engine.py)
+    engine_class = ENGINES[args.engine]
+    if args.prepare and not engine_class.supports_prepare:
+        parser.error(f"The {args.engine} engine doesn't support --prepare.")
+    if args.profile and not engine_class.supports_profiling:
+        parser.error(f"The {args.engine} engine doesn't support --profile.")
+    if args.cache is not None and args.profile:
+        parser.error(
+            "--profile can't be combined with --cache: cache hits don't run their query and thus have no profile."
+        )
 
-    # Check whether the binary is available.
-    if not os.path.isfile(args.duckdb_cli):
+    # Check whether the binary is available, if it runs the queries or sets up
+    # IMDb for DuckDB (see `main`)
+    needs_duckdb_cli = args.engine == "duckdb_cli" or (
+        args.engine == "duckdb" and args.db is None
+    )
+    if needs_duckdb_cli and not os.path.isfile(args.duckdb_cli):
         print(f"Couldn't find {args.duckdb_cli}. Please install DuckDB and try again.")
         sys.exit(-1)
 
     return args
 
 
-# TIP: Simply modify this to run Redbench on your system
-def run_sql_cmd(duckdb_cli, db_file, sql_file):
-    os.system(f"{duckdb_cli} --readonly {db_file} < {sql_file} > /dev/null 2>&1")
+# Run Redbench query by query on a single connection
+def run_sequential(
+    runner,
+    results_db_filepath,
+    parquet_filepath=None,
+    workloads=None,
+    profile=False,
+    prepare=False,
+    sample_interval_s=None,
+):
+    log(f"Running Redbench on {get_engine_description(runner.engine)}..")
+    runner.run(
+        names=workloads,
+        profile=profile,
+        prepare=prepare,
+        sample_interval_s=sample_interval_s,
+    )
+    log(f"Per-query results written to table query_results in {results_db_filepath}.")
+    if parquet_filepath is not None:
+        runner.export_results(parquet_filepath)
 
+    # Prepare and print the results table
+    results_table = PrettyTable()
+    results_table.field_names = [
+        "Query repetition bucket",
+        "Queries",
+        "Timeouts",
+        "Errors",
+        "Total execution time",
+        "p50 (ms)",
+        "p95 (ms)",
+        "p99 (ms)",
+    ]
+    for (
+        bucket_name,
+        num_queries,
+        num_timeouts,
+        num_errors,
+        total_ms,
+        p50,
+        p95,
+        p99,
+    ) in runner.get_summary():
+        results_table.add_row(
+            [
+                bucket_name,
+                num_queries,
+                num_timeouts,
+                num_errors,
+                str(timedelta(milliseconds=total_ms)),
+                f"{p50:.2f}",
+                f"{p95:.2f}",
+                f"{p99:.2f}",
+            ]
+        )
+    print(results_table)
+
+    if sample_interval_s is not None:
+        log(
+            f"Resource samples written to table resource_samples in {results_db_filepath}."
+        )
+        resource_table = PrettyTable()
+        resource_table.field_names = [
+            "Query repetition bucket",
+            "Peak RSS (MB)",
+            "Mean RSS (MB)",
+            "Peak engine memory (MB)",
+            "Mean engine memory (MB)",
+            "CPU time",
+            "CPU utilization",
+            "Read (MB)",
+            "Written (MB)",
+        ]
+        for row in runner.get_resource_summary():
+            bucket_name, cpu_time_ms, cpu_utilization = row[0], row[5], row[6]
+            resource_table.add_row(
+                [bucket_name]
+                + [format_megabytes(value) for value in row[1:5]]
+                + [
+                    str(timedelta(milliseconds=cpu_time_ms or 0)),
+                    f"{cpu_utilization:.0%}" if cpu_utilization is not None else "-",
+                ]
+                + [format_megabytes(value) for value in row[7:9]]
+            )
+        print(resource_table)
+
+    if prepare:
+        planning_table = PrettyTable()
+        planning_table.field_names = [
+            "Query repetition bucket",
+            "Queries",
+            "Plan reuses",
+            "Planning time",
+            "Execution time",
+            "Planning time saved",
+        ]
+        for (
+            bucket_name,
+            num_queries,
+            num_plan_reuses,
+            planning_ms,
+            execution_ms,
+            saved_planning_ms,
+        ) in runner.get_planning_summary():
+            planning_table.add_row(
+                [
+                    bucket_name,
+                    num_queries,
+                    num_plan_reuses,
+                    str(timedelta(milliseconds=planning_ms)),
+                    str(timedelta(milliseconds=execution_ms)),
+                    str(timedelta(milliseconds=saved_planning_ms)),
+                ]
+            )
+        print(planning_table)
+
+    if profile:
+        log(
+            f"Operator profiles written to table operator_profiles in {results_db_filepath}."
+        )
+        profile_table = PrettyTable()
+        profile_table.field_names = [
+            "Query repetition bucket",
+            "Operator category",
+            "Operators",
+            "Total operator time",
+            "Share of operator time",
+            "Total cardinality",
+        ]
+        for (
+            bucket_name,
+            operator_category,
+            num_operators,
+            total_ms,
+            time_share,
+            total_cardinality,
+        ) in runner.get_operator_summary():
+            profile_table.add_row(
+                [
+                    bucket_name,
+                    operator_category,
+                    num_operators,
+                    str(timedelta(milliseconds=total_ms)),
+                    f"{time_share:.1%}",
+                    total_cardinality,
+                ]
+            )
+        print(profile_table)
+
+    if isinstance(runner.engine, CachingEngine):
+        log(f"Result cache stats written to table cache_stats in {results_db_filepath}.")
+        cache_table = PrettyTable()
+        cache_table.field_names = [
+            "Query repetition bucket",
+            "Cache hit rate",
+            "Expected hit rate",
+            "Peak bytes cached",
+            "Time saved",
+        ]
+        for (
+            bucket_name,
+            hit_rate,
+            expected_hit_rate,
+            peak_bytes,
+            time_saved_ms,
+        ) in runner.get_cache_summary():
+            cache_table.add_row(
+                [
+                    bucket_name,
+                    f"{hit_rate:.1%}",
+                    f"{expected_hit_rate:.1%}",
+                    peak_bytes,
+                    str(timedelta(milliseconds=time_saved_ms)),
+                ]
+            )
+        print(cache_table)
 
-# Run Redbench
-def main(duckdb_cli):
-    # Download and setup the IMDb database and its benchmarks JOB and CEB
-    setup_imdb_db(duckdb_cli)
-
-    # Extract the duckdb version.
-    duckdb_version = get_duckdb_version(duckdb_cli)
-    assert (
-        duckdb_version is not None
-    ), "Something went wrong when extracting the version of your DuckDB binary."
-    log(f"Running Redbench on DuckDB {duckdb_version}..")
-
-    exec_times = dict()
-    # Iterate over the query repetition buckets
-    for subdir in sorted(get_sub_directories(WORKLOADS_DIR)):
-        bucket_name = os.path.basename(subdir)
-        log(f"Running Redbench bucket {bucket_name}..")
-        start_time = time.perf_counter_ns()
-        # Iterate over the 3 different variability workloads for this bucket
-        for filename in os.listdir(subdir):
-            if not filename.endswith(".sql"):
-                continue
-            filepath = os.path.join(subdir, filename)
-
-            # And run.
-            run_sql_cmd(duckdb_cli, "imdb/db.duckdb", filepath)
-        exec_times[bucket_name] = (time.perf_counter_ns() - start_time) / 1e9
+
+# Run Redbench repeatedly and report robust statistics over the runs
+def run_trials(
+    runner,
+    results_db_filepath,
+    workloads=None,
+    repetitions=5,
+    warmup=0,
+    mode="warm",
+    target_ci_width=None,
+    max_repetitions=30,
+):
+    log(f"Running Redbench repeatedly on {get_engine_description(runner.engine)}..")
+    stats = runner.run_trials(
+        get_workloads(names=workloads),
+        repetitions,
+        warmup,
+        mode,
+        target_ci_width,
+        max_repetitions,
+    )
+    log(f"Per-query results written to table trial_results in {results_db_filepath}.")
 
     # Prepare and print the results table
     results_table = PrettyTable()
-    results_table.field_names = ["Query repetition bucket", "Total execution time"]
-    for bucket_name, exec_time in exec_times.items():
-        results_table.add_row([bucket_name, str(timedelta(seconds=exec_time))])
+    results_table.field_names = [
+        "Query repetition bucket / workload",
+        "Runs",
+        "Median execution time",
+        "IQR (ms)",
+        "95% CI of the median (ms)",
+    ]
+    for level, name, num_runs, median, iqr, ci_lo, ci_hi in stats:
+        results_table.add_row(
+            [
+                name,
+                num_runs,
+                str(timedelta(milliseconds=median)),
+                f"{iqr:.2f}",
+                f"[{ci_lo:.2f}, {ci_hi:.2f}]",
+            ]
+        )
     print(results_table)
+    print_failures(runner, "trial_results")
+
+
+# Replay Redbench workloads as concurrent client streams
+def run_concurrent(
+    runner,
+    results_db_filepath,
+    workloads=None,
+    copies=1,
+    pool_size=None,
+    use_processes=False,
+):
+    log(f"Running Redbench concurrently on {get_engine_description(runner.engine)}..")
+    aggregate, stream_stats = runner.run_concurrent(
+        get_workloads(names=workloads), copies, pool_size, use_processes
+    )
+    log(f"Per-query results written to table stream_results in {results_db_filepath}.")
+
+    # Prepare and print the per-stream results table
+    results_table = PrettyTable()
+    results_table.field_names = [
+        "Stream",
+        "Workload",
+        "Queries",
+        "Total execution time",
+        "p50 (ms)",
+        "p95 (ms)",
+        "p99 (ms)",
+        "Slowdown",
+    ]
+    for stream in stream_stats:
+        results_table.add_row(
+            [
+                stream["stream_id"],
+                stream["workload"],
+                stream["num_queries"],
+                str(timedelta(milliseconds=stream["total_ms"])),
+                f"{stream['p50_ms']:.2f}",
+                f"{stream['p95_ms']:.2f}",
+                f"{stream['p99_ms']:.2f}",
+                f"{stream['slowdown']:.2f}x",
+            ]
+        )
+    print(results_table)
+    print(
+        f"{aggregate['num_streams']} streams, {aggregate['num_queries']} queries in "
+        f"{timedelta(seconds=aggregate['wall_time_s'])}: "
+        f"{aggregate['qps']:.2f} QPS ({aggregate['isolated_qps']:.2f} QPS isolated), "
+        f"p50/p95/p99 = {aggregate['p50_ms']:.2f}/{aggregate['p95_ms']:.2f}/{aggregate['p99_ms']:.2f} ms, "
+        f"mean slowdown {aggregate['mean_slowdown']:.2f}x"
+    )
+    print_failures(runner, "stream_results")
+
+
+# Replay Redbench workloads open-loop, following the Redset arrival times
+def run_open_loop(
+    runner, results_db_filepath, workloads=None, time_compression=1000, pool_size=None
+):
+    log(f"Running Redbench open-loop on {get_engine_description(runner.engine)}..")
+    # Older workloads don't carry arrival timestamps -> look them up in Redset
+    redset_db = (
+        duckdb.connect(DB_FILEPATH, read_only=True)
+        if os.path.exists(DB_FILEPATH)
+        else None
+    )
+    runner.run_open_loop(
+        get_workloads(names=workloads), time_compression, pool_size, redset_db
+    )
+    log(
+        f"Per-query results written to table open_loop_results in {results_db_filepath}."
+    )
+
+    # Prepare and print the results table
+    results_table = PrettyTable()
+    results_table.field_names = [
+        "Workload",
+        "Queries",
+        "Replay time",
+        "Queueing p50/p95/p99 (ms)",
+        "Execution p50/p95/p99 (ms)",
+    ]
+    for row in runner.get_open_loop_summary():
+        bucket_name, workload_type, num_queries, replay_ms = row[:4]
+        results_table.add_row(
+            [
+                f"{bucket_name}/{workload_type}",
+                num_queries,
+                str(timedelta(milliseconds=replay_ms)),
+                "/".join(f"{value:.2f}" for value in row[4:7]),
+                "/".join(f"{value:.2f}" for value in row[7:10]),
+            ]
+        )
+    print(results_table)
+    print_failures(runner, "open_loop_results")
+
+
+# Report the timed out and failed queries per bucket, if there are any
+def print_failures(runner, table_name):
+    failures = runner.get_failure_summary(table_name)
+    if len(failures) == 0:
+        return
+    log(f"Some queries timed out or failed, see the columns status and error of {table_name}.")
+    failures_table = PrettyTable()
+    failures_table.field_names = [
+        "Query repetition bucket",
+        "Queries",
+        "Timeouts",
+        "Errors",
+    ]
+    for row in failures:
+        failures_table.add_row(list(row))
+    print(failures_table)
+
+
+def format_megabytes(num_bytes):
+    return f"{num_bytes / 1e6:.1f}" if num_bytes is not None else "-"
+
+
+def get_engine_description(engine):
+    version = engine.get_version()
+    return f"{engine.name}{f' {version}' if version is not None else ''}"
+
+
+# Run Redbench
+def main(args):
+    if args.engine in ["duckdb", "duckdb_cli"] and args.db is None:
+        # Download and setup the IMDb database and its benchmarks JOB and CEB
+        setup_imdb_db(args.duckdb_cli)
+
+    engine = get_engine(
+        args.engine,
+        db_filepath=args.db,
+        duckdb_cli=args.duckdb_cli,
+        driver=args.driver,
+        dsn=args.dsn,
+    )
+    if args.cache is not None:
+        engine = CachingEngine(
+            engine, ResultCache(args.cache, args.cache_entries, args.cache_bytes)
+        )
+    runner = Runner(engine, get_results_db(args.output), args.timeout)
+
+    if args.trials:
+        run_trials(
+            runner,
+            args.output,
+            args.workloads,
+            args.repetitions,
+            args.warmup,
+            args.mode,
+            args.target_ci_width,
+            args.max_repetitions,
+        )
+    elif args.open_loop:
+        run_open_loop(
+            runner, args.output, args.workloads, args.time_compression, args.pool_size
+        )
+    elif args.concurrent:
+        run_concurrent(
+            runner,
+            args.output,
+            args.workloads,
+            args.copies,
+            args.pool_size,
+            args.processes,
+        )
+    else:
+        run_sequential(
+            runner,
+            args.output,
+            args.parquet,
+            args.workloads,
+            args.profile,
+            args.prepare,
+            args.sample_interval,
+        )
 
 
 # And run
 if __name__ == "__main__":
-    main(parse_args().duckdb_cli)
+    main(parse_args())
@@ -1,41 +1,91 @@
 from src.utils import *
 from src.redbench import WORKLOADS_DIR
-from collections import defaultdict
+from src.corpus import read_query_file
+from src.packed_workload import pack_workloads
+from src.manifest import Manifest, get_workload_inputs
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from src.benchmarks.imdb import IMDbBenchmark
 import os
+import argparse
+import multiprocessing
+
+
+# Every query file is read once per process, no matter how often workloads repeat it
+@lru_cache(maxsize=None)
+def read_query(query_path):
+    query = read_query_file(query_path).strip()
+    return query + (";" if not query.endswith(";") else "")
+
+
+# Unpack a single workload csv into a runnable sql file, query by query
+def unpack_workload(csv_filepath):
+    num_queries = 0
+    with open(csv_filepath, "r") as csv_file, open(
+        csv_filepath.replace(".csv", ".sql"), "w"
+    ) as sql_workload_file:
+        # Skip the header
+        next(csv_file, None)
+        for line in csv_file:
+            query_path = line.split(",")[0]
+            sql_workload_file.write(f"-- {query_path}\n{read_query(query_path)}\n\n")
+            num_queries += 1
+    return num_queries
 
 
 # Unpack/ inline the workload queries (convert the csv files to runnable sql files)
-def unpack_workloads():
-    num_queries = defaultdict(int)
+# Only workloads whose csv file, queries, or generator version changed are unpacked again.
+def unpack_workloads(max_workers=None, override=False):
+    manifest = Manifest()
+    csv_filepaths, pending = [], []
     # Iterate over the query repetition groups
     for subdir in sorted(get_sub_directories(WORKLOADS_DIR)):
-        group_name = os.path.basename(subdir)
         # Iterate over the 3 different variability workloads for this group
-        for filename in os.listdir(subdir):
+        for filename in sorted(os.listdir(subdir)):
             if not filename.endswith(".csv") or filename == "stats.csv":
                 continue
-            # Read the workload csv
-            with open(os.path.join(subdir, filename), "r") as csv_file:
-                workload = csv_file.readlines()[1:]
-            sql_workload = ""
-            # Unpack the queries
-            for line in workload:
-                num_queries[group_name] += 1
-                query_path = line.split(",")[0]
-                with open(query_path, "r") as query_file:
-                    query = query_file.read().strip()
-                    query += ";" if not query.endswith(";") else ""
-                    sql_workload += f"-- {query_path}\n{query}\n\n"
-            # Write the unpacked workload to a new sql file
-            with open(
-                os.path.join(subdir, filename.replace(".csv", ".sql")), "w"
-            ) as sql_workload_file:
-                sql_workload_file.write(sql_workload)
-    log("Finished unpacking Redbench workloads.")
+            csv_filepath = os.path.join(subdir, filename)
+            csv_filepaths.append(csv_filepath)
+            inputs = get_workload_inputs(csv_filepath)
+            if override or not manifest.is_up_to_date(
+                csv_filepath.replace(".csv", ".sql"), inputs
+            ):
+                pending.append((csv_filepath, inputs))
+    # The workloads are independent of each other -> unpack them in parallel
+    num_queries = 0
+    if len(pending) > 0:
+        # Don't fork a process that may already run DuckDB threads
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            num_queries = sum(
+                executor.map(unpack_workload, [csv_filepath for csv_filepath, _ in pending])
+            )
+    for csv_filepath, inputs in pending:
+        manifest.record(csv_filepath.replace(".csv", ".sql"), inputs)
+    manifest.save()
+    log(
+        f"Finished unpacking {len(pending)} Redbench workloads ({num_queries} queries), {len(csv_filepaths) - len(pending)} already up to date."
+    )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up Redbench.")
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Also write every workload in the compact packed format: its distinct queries once, plus columnar per-query arrays (see src/packed_workload.py).",
+    )
+    parser.add_argument(
+        "-o",
+        "--override",
+        action="store_true",
+        help="Unpack all workloads, even those that are up to date according to workloads/manifest.json.",
+    )
+    args = parser.parse_args()
+
     # Setup JOB and CEB
     IMDbBenchmark().setup()
-    unpack_workloads()
+    unpack_workloads(override=args.override)
+    if args.packed:
+        pack_workloads(WORKLOADS_DIR, override=args.override)
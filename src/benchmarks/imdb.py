@@ -1,7 +1,15 @@
 import os
+import json
+import hashlib
+import multiprocessing
+import duckdb
+import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from .benchmark import Benchmark
+from .join_graph import extract_join_graph
 from ..utils import *
+from ..corpus import CORPUS_FILEPATH, build_corpus, get_corpus
 import re
 import queue
 import threading
@@ -16,8 +24,58 @@ MAX_NUM_JOINS_ALLOWED = 11
 CEB_DIR_PATH = "imdb/benchmarks/ceb"
 JOB_DIR_PATH = "imdb/benchmarks/job"
 
-TMP_QUERY_FILEPATH = f"tmp/query.sql"
-PROFILE_FILEPATH = f"tmp/query_profile.json"
+# Per-query stats, keyed by (query content hash, DuckDB version, stats schema version)
+STATS_CACHE_TABLE = "imdb_stats_cache"
+# Bump whenever the stats change for the same query and DuckDB version
+STATS_SCHEMA_VERSION = 2
+# Columns of the stats cache besides its key, and their types
+STATS_COLUMNS = {
+    "num_joins": "INTEGER",
+    "template": "VARCHAR",
+    # From the static join graph (see join_graph.py)
+    "tables": "VARCHAR[]",
+    "join_edges": "VARCHAR[]",
+    "predicate_columns": "VARCHAR[]",
+    "static_num_joins": "INTEGER",
+}
+
+
+def count_joins_in_plan(plan):
+    """
+    Number of joins in a physical plan, given as the output of EXPLAIN (FORMAT JSON).
+    IN lists are planned as hash joins with a COLUMN_DATA_SCAN of the list's
+    values, so these don't count as joins.
+    """
+    num_hash_joins, num_column_data_scans = 0, 0
+    nodes = list(plan)
+    while len(nodes) > 0:
+        node = nodes.pop()
+        name = node["name"].strip()
+        num_hash_joins += name == "HASH_JOIN"
+        num_column_data_scans += name == "COLUMN_DATA_SCAN"
+        nodes.extend(node["children"])
+    return num_hash_joins - num_column_data_scans
+
+
+# Connection of the current worker process of `compute_stats`
+_worker_con = None
+
+
+def _init_worker(db_filepath):
+    # Every worker plans on its own in-process connection, so workers don't
+    # share any state
+    global _worker_con
+    _worker_con = duckdb.connect(db_filepath, read_only=True)
+
+
+def _count_joins(filepath):
+    query = get_corpus().get(filepath).strip().rstrip(";")
+    _, plan = _worker_con.execute(f"EXPLAIN (FORMAT JSON) {query}").fetchone()
+    return count_joins_in_plan(json.loads(plan))
+
+
+def _get_join_graph(filepath):
+    return extract_join_graph(get_corpus().get(filepath))
 
 
 def setup_imdb_db(duckdb_cli, override=False):
@@ -45,31 +103,72 @@ class IMDbBenchmark(Benchmark):
         target_benchmark: str
             The target benchmark to setup and compute stats on.
             Either "job", "ceb", or "ceb_job".
+        num_workers: int
+            Number of processes planning queries in `compute_stats`
+            (default: one per core).
         """
         super().__init__(**kwargs)
         self.target_benchmark = kwargs.get("target_benchmark", None)
+        self.num_workers = kwargs.get("num_workers", None)
         os.system("mkdir tmp")
 
     def _is_benchmarks_setup(self):
-        return os.path.exists(JOB_DIR_PATH) and os.path.exists(CEB_DIR_PATH)
+        return os.path.exists(CORPUS_FILEPATH) and get_corpus() is not None
 
     def setup(self, override=False):
         if not override and self._is_benchmarks_setup():
             log("IMDb benchmarks already set up.")
             return
         log("Setting up IMDb benchmarks JOB and CEB...")
-        os.system("rm -rf imdb/benchmarks")
-        os.system("tar -xzf imdb/benchmarks.tar.gz -C imdb/")
+        # Instead of extracting ~13k small files, pack them into one corpus
+        # file, keyed by their imdb/benchmarks/... filepaths
+        build_corpus()
+
+    def _create_stats_cache(self, override):
+        columns = {
+            "filepath": "VARCHAR",
+            "content_hash": "VARCHAR",
+            "duckdb_version": "VARCHAR",
+            "schema_version": "INTEGER",
+            **STATS_COLUMNS,
+        }
+        existing_columns = [
+            column
+            for (column,) in self.stats_db.execute(
+                f"""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = '{STATS_CACHE_TABLE}'
+                ORDER BY ordinal_position
+            """
+            ).fetchall()
+        ]
+        # A cache of another stats schema is stale as a whole
+        if override or existing_columns not in [[], list(columns)]:
+            self.stats_db.execute(f"DROP TABLE IF EXISTS {STATS_CACHE_TABLE}")
+        column_definitions = ", ".join(
+            f"{column} {column_type}" for column, column_type in columns.items()
+        )
+        self.stats_db.execute(
+            f"CREATE TABLE IF NOT EXISTS {STATS_CACHE_TABLE} ({column_definitions})"
+        )
 
     def _create_stats_tables(self):
-        for benchmark_name in ["job", "ceb", "ceb_job"]:
+        # The stats of the current DuckDB version, from the cache
+        for benchmark_name, filepath_prefix in [
+            ("job", f"{JOB_DIR_PATH}/"),
+            ("ceb", f"{CEB_DIR_PATH}/"),
+            ("ceb_job", "imdb/benchmarks/"),
+        ]:
             self.stats_db.execute(
                 f"""
-                CREATE OR REPLACE TABLE {benchmark_name}_stats (
-                    filepath VARCHAR,
-                    num_joins INTEGER,
-                    template VARCHAR
-                )
+                CREATE OR REPLACE TABLE {benchmark_name}_stats AS
+                SELECT filepath, {", ".join(STATS_COLUMNS)}
+                FROM {STATS_CACHE_TABLE}
+                WHERE
+                    duckdb_version = '{duckdb.__version__}'
+                    AND schema_version = {STATS_SCHEMA_VERSION}
+                    AND starts_with(filepath, '{filepath_prefix}')
             """
             )
 
@@ -87,91 +186,148 @@ class IMDbBenchmark(Benchmark):
 
 
     def _process_dir(self, dir_path, query_stats):
-        template_to_num_joins = dict()
-        for filename in os.listdir(dir_path):
-            filepath = os.path.join(dir_path, filename)
+        corpus = get_corpus()
+        for filepath in corpus.list_dir(dir_path):
             template = self._extract_template_from_filepath(filepath)
-            if template in template_to_num_joins:
-                query_stats[filepath] = {
-                    "num_joins": template_to_num_joins[template],
-                    "template": template,
-                }
-                continue
-
-            # Read query
-            with open(filepath, "r") as file:
-                query = file.read()
-
-            # Get number of joins in the execution plan
-            with open(TMP_QUERY_FILEPATH, "w") as file:
-                file.write(
-                    f"""
-                    PRAGMA enable_profiling='json';
-                    PRAGMA profiling_output = '{PROFILE_FILEPATH}';
-                    {query};
-                """
-                )
-            os.system(
-                f"{self.duckdb_cli} imdb/db.duckdb < {TMP_QUERY_FILEPATH} > /dev/null"
-            )
-            with open(PROFILE_FILEPATH, "r") as file:
-                profile = file.read()
-            os.remove(PROFILE_FILEPATH)
-            os.remove(TMP_QUERY_FILEPATH)
-
-            num_joins = profile.count('"operator_type": "HASH_JOIN"') - profile.count(
-                '"operator_type": "COLUMN_DATA_SCAN"'
-            )
-            template_to_num_joins[template] = num_joins
-
             query_stats[filepath] = {
-                "num_joins": num_joins,
+                "content_hash": hashlib.sha1(corpus.get_bytes(filepath)).hexdigest(),
                 "template": template,
             }
 
-    def _is_stats_setup(self):
-        return all(
-            self.stats_db.execute(
-                f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='{table}_stats'"
-            ).fetchone()[0]
-            > 0
-            for table in ["job", "ceb", "ceb_job"]
-        ) and all(
-            self.stats_db.execute(f"SELECT COUNT(*) FROM {table}_stats").fetchone()[0] > 0
-            for table in ["job", "ceb", "ceb_job"]
+    def _evict_stale_stats(self, content_hashes):
+        # Rows of query files that changed or no longer exist, and rows of
+        # older stats schemas. Rows of other DuckDB versions are kept.
+        current_df = pd.DataFrame(
+            list(content_hashes.items()), columns=["filepath", "content_hash"]
+        )
+        self.stats_db.execute(
+            f"""
+            DELETE FROM {STATS_CACHE_TABLE} c
+            WHERE
+                schema_version != {STATS_SCHEMA_VERSION}
+                OR NOT EXISTS (
+                    SELECT 1
+                    FROM current_df q
+                    WHERE q.filepath = c.filepath AND q.content_hash = c.content_hash
+                )
+        """
         )
 
     def compute_stats(self, override=False):
-        if not override and self._is_stats_setup():
-            log("IMDb benchmark stats already set up.")
-            return
-
-        self._create_stats_tables()
+        """
+        Computes the stats of all JOB and CEB queries, cached persistently
+        across runs and DuckDB versions in the table imdb_stats_cache.
+        Only query files that changed or aren't cached for the current DuckDB
+        version and stats schema are planned again.
+        """
+        self._create_stats_cache(override)
         benchmark_stats = defaultdict(dict)
 
-        log("Collecting stats for JOB queries..")
-        self._process_dir(JOB_DIR_PATH, benchmark_stats["job"])
-
-        log("Collecting stats for CEB queries..")
-        for subdir in get_sub_directories(CEB_DIR_PATH):
-            self._process_dir(subdir, benchmark_stats["ceb"])
+        log("Collecting JOB and CEB queries..")
+        for benchmark_name, dir_paths in [
+            ("job", [JOB_DIR_PATH]),
+            ("ceb", get_corpus().get_sub_directories(CEB_DIR_PATH)),
+        ]:
+            for dir_path in dir_paths:
+                self._process_dir(dir_path, benchmark_stats[benchmark_name])
+        self._evict_stale_stats(
+            {
+                filepath: stats["content_hash"]
+                for query_stats in benchmark_stats.values()
+                for filepath, stats in query_stats.items()
+            }
+        )
+        cached_filepaths = set(
+            filepath
+            for (filepath,) in self.stats_db.execute(
+                f"""
+                SELECT filepath
+                FROM {STATS_CACHE_TABLE}
+                WHERE duckdb_version = '{duckdb.__version__}'
+            """
+            ).fetchall()
+        )
 
+        # All query instances of a template have the same number of joins,
+        # so we only plan one uncached instance of every template
+        representatives = defaultdict(dict)
         for benchmark_name, query_stats in benchmark_stats.items():
             for filepath, stats in query_stats.items():
-                self._insert_stats(filepath, stats, benchmark_name)
-                self._insert_stats(filepath, stats, "ceb_job")
+                if filepath not in cached_filepaths:
+                    representatives[benchmark_name].setdefault(
+                        stats["template"], filepath
+                    )
+        tasks = [
+            (benchmark_name, template, filepath)
+            for benchmark_name, templates in representatives.items()
+            for template, filepath in sorted(templates.items())
+        ]
+        if len(tasks) == 0:
+            log(f"IMDb benchmark stats already set up for DuckDB {duckdb.__version__}.")
+            self._create_stats_tables()
+            return
 
-    def _insert_stats(self, filepath, query_stats, benchmark_name):
-        self.stats_db.execute(
-            f"""
-            INSERT INTO {benchmark_name}_stats
-            VALUES (
-                '{filepath}',
-                {query_stats["num_joins"]},
-                '{query_stats["template"]}'
+        # Get the number of joins from the optimized plans, planned in parallel,
+        # and the join graphs of all uncached queries
+        log(f"Planning {len(tasks)} query templates with DuckDB {duckdb.__version__}..")
+        uncached_filepaths = [
+            filepath
+            for query_stats in benchmark_stats.values()
+            for filepath in query_stats
+            if filepath not in cached_filepaths
+        ]
+        # Don't fork the multi-threaded DuckDB of this process
+        with ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(IMDB_DB_FILEPATH,),
+        ) as executor:
+            num_joins = list(
+                executor.map(_count_joins, [filepath for _, _, filepath in tasks])
             )
-        """
+            join_graphs = dict(
+                zip(
+                    uncached_filepaths,
+                    executor.map(_get_join_graph, uncached_filepaths, chunksize=256),
+                )
+            )
+        template_to_num_joins = {
+            (benchmark_name, template): n
+            for (benchmark_name, template, _), n in zip(tasks, num_joins)
+        }
+
+        new_stats_df = pd.DataFrame(
+            [
+                (
+                    filepath,
+                    stats["content_hash"],
+                    duckdb.__version__,
+                    STATS_SCHEMA_VERSION,
+                    template_to_num_joins[(benchmark_name, stats["template"])],
+                    stats["template"],
+                    join_graphs[filepath]["tables"],
+                    join_graphs[filepath]["join_edges"],
+                    join_graphs[filepath]["predicate_columns"],
+                    join_graphs[filepath]["num_joins"],
+                )
+                for benchmark_name, query_stats in benchmark_stats.items()
+                for filepath, stats in query_stats.items()
+                if filepath not in cached_filepaths
+            ],
+            columns=[
+                "filepath",
+                "content_hash",
+                "duckdb_version",
+                "schema_version",
+            ]
+            + list(STATS_COLUMNS),
+        )
+        self.stats_db.execute(
+            f"INSERT INTO {STATS_CACHE_TABLE} BY NAME SELECT * FROM new_stats_df"
         )
+        log(f"Cached the stats of {len(new_stats_df)} queries.")
+        self._create_stats_tables()
 
     def get_stats(
         self,
@@ -192,8 +348,13 @@ class IMDbBenchmark(Benchmark):
             .to_dict(orient="records")
         ):
             benchmark_stats[row["filepath"]] = {
-                "num_joins": row["num_joins"],
-                "template": row["template"],
+                # Lists come as numpy arrays from the data frame
+                column: (
+                    list(row[column])
+                    if STATS_COLUMNS[column].endswith("[]")
+                    else row[column]
+                )
+                for column in STATS_COLUMNS
             }
         return (
             bound_num_joins(benchmark_stats, min_joins=bounds[0], max_joins=bounds[1])
@@ -0,0 +1,134 @@
+import re
+
+
+# String literals, e.g. '%(co-production)%' or 'it''s'
+STRING_LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'")
+# alias.column, but not the digits of a decimal number
+COLUMN_REF_REGEX = re.compile(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b")
+JOIN_PREDICATE_REGEX = re.compile(
+    r"^([A-Za-z_]\w*)\.([A-Za-z_]\w*)\s*=\s*([A-Za-z_]\w*)\.([A-Za-z_]\w*)$"
+)
+# Clauses ending the FROM or WHERE clause
+CLAUSE_END_REGEX = re.compile(r"\b(?:GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT)\b", re.IGNORECASE)
+
+
+def _split_top_level(text, separator_regex):
+    # Splits `text` at the separators that aren't nested in parentheses
+    parts, depth, start = [], 0, 0
+    for match in re.finditer(rf"\(|\)|{separator_regex}", text, re.IGNORECASE):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            parts.append(text[start : match.start()])
+            start = match.end()
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _strip_parentheses(text):
+    # Removes parentheses around the whole text, e.g. "((a = 1))" -> "a = 1"
+    while text.startswith("(") and text.endswith(")"):
+        depth = 0
+        for i, char in enumerate(text):
+            depth += char == "("
+            depth -= char == ")"
+            if depth == 0 and i < len(text) - 1:
+                return text
+        text = text[1:-1].strip()
+    return text
+
+
+def _split_conjuncts(where_clause):
+    conjuncts = []
+    for part in _split_top_level(where_clause, r"\bAND\b"):
+        # The AND of "x BETWEEN a AND b" doesn't separate two conjuncts
+        if len(conjuncts) > 0 and re.search(
+            r"\bBETWEEN\s+\S+$", conjuncts[-1], re.IGNORECASE
+        ):
+            conjuncts[-1] += f" AND {part}"
+        else:
+            conjuncts.append(part)
+    return [_strip_parentheses(conjunct) for conjunct in conjuncts]
+
+
+def extract_join_graph(query):
+    """
+    Statically extracts the join graph of a JOB/CEB-style query, i.e. a
+    "SELECT ... FROM <table> [AS] <alias>, ... WHERE <conjuncts>" query,
+    without running or planning it.
+
+    Returns a dict with the sorted distinct `tables` read by the query, its
+    `join_edges` ("table.column = table.column" equi-join predicates between
+    two relations), its `predicate_columns` ("table.column" used by any other
+    predicate), and its `num_joins`, i.e. the number of joins needed to
+    connect all relations of the join graph (cross products excluded).
+    """
+    # Literals may contain anything, e.g. "." or keywords -> blank them out
+    query = STRING_LITERAL_REGEX.sub("''", query)
+    query = re.sub(r"--[^\n]*", "", query).strip().rstrip(";")
+
+    from_match = re.search(r"\bFROM\b", query, re.IGNORECASE)
+    assert from_match is not None, "Query without FROM clause"
+    rest = query[from_match.end() :]
+    where_match = re.search(r"\bWHERE\b", rest, re.IGNORECASE)
+    from_clause = rest[: where_match.start()] if where_match else rest
+    where_clause = rest[where_match.end() :] if where_match else ""
+    end_match = CLAUSE_END_REGEX.search(from_clause)
+    if end_match:
+        from_clause = from_clause[: end_match.start()]
+    end_match = CLAUSE_END_REGEX.search(where_clause)
+    if end_match:
+        where_clause = where_clause[: end_match.start()]
+
+    # alias -> table
+    relations = dict()
+    for item in _split_top_level(from_clause, ","):
+        tokens = item.split()
+        table = tokens[0]
+        alias = tokens[-1] if len(tokens) > 1 else table
+        relations[alias] = table
+
+    # Union-find over the relations to count the joins connecting them
+    parents = {alias: alias for alias in relations}
+
+    def find(alias):
+        while parents[alias] != alias:
+            alias = parents[alias]
+        return alias
+
+    join_edges, predicate_columns = set(), set()
+    for conjunct in _split_conjuncts(where_clause):
+        match = JOIN_PREDICATE_REGEX.match(conjunct)
+        if (
+            match
+            and match.group(1) in relations
+            and match.group(3) in relations
+            and match.group(1) != match.group(3)
+        ):
+            left_alias, left_column, right_alias, right_column = match.groups()
+            join_edges.add(
+                " = ".join(
+                    sorted(
+                        [
+                            f"{relations[left_alias]}.{left_column}",
+                            f"{relations[right_alias]}.{right_column}",
+                        ]
+                    )
+                )
+            )
+            parents[find(left_alias)] = find(right_alias)
+            continue
+        for alias, column in COLUMN_REF_REGEX.findall(conjunct):
+            if alias in relations:
+                predicate_columns.add(f"{relations[alias]}.{column}")
+
+    num_components = len(set(find(alias) for alias in relations))
+    return {
+        "tables": sorted(set(relations.values())),
+        "join_edges": sorted(join_edges),
+        "predicate_columns": sorted(predicate_columns),
+        "num_joins": len(relations) - num_components,
+    }
@@ -0,0 +1,129 @@
+import os
+import json
+import mmap
+import tarfile
+from .utils import log
+
+
+BENCHMARKS_TARBALL_FILEPATH = "imdb/benchmarks.tar.gz"
+# All benchmark queries back to back, and their (offset, length) in it keyed by filepath
+CORPUS_FILEPATH = "imdb/benchmarks.corpus"
+CORPUS_INDEX_FILEPATH = "imdb/benchmarks.corpus.json"
+
+
+def build_corpus(
+    tarball_filepath=BENCHMARKS_TARBALL_FILEPATH,
+    corpus_filepath=CORPUS_FILEPATH,
+    index_filepath=CORPUS_INDEX_FILEPATH,
+):
+    """
+    Packs the .sql files of the benchmarks tarball into a single corpus file.
+    The queries are keyed by the filepath they'd have when extracted into imdb/,
+    e.g. "imdb/benchmarks/job/1a.sql", such that existing workload csv files
+    can be resolved against the corpus unchanged.
+    """
+    prefix = os.path.dirname(tarball_filepath)
+    index = dict()
+    offset = 0
+    with tarfile.open(tarball_filepath, "r:gz") as tarball, open(
+        f"{corpus_filepath}.tmp", "wb"
+    ) as corpus_file:
+        for member in tarball:
+            if not member.isfile() or not member.name.endswith(".sql"):
+                continue
+            query = tarball.extractfile(member).read()
+            corpus_file.write(query)
+            index[os.path.join(prefix, os.path.normpath(member.name))] = (
+                offset,
+                len(query),
+            )
+            offset += len(query)
+    with open(f"{index_filepath}.tmp", "w") as index_file:
+        json.dump(dict(sorted(index.items())), index_file)
+    # Only publish complete corpora
+    os.replace(f"{corpus_filepath}.tmp", corpus_filepath)
+    os.replace(f"{index_filepath}.tmp", index_filepath)
+    log(f"Packed {len(index)} benchmark queries into {corpus_filepath}.")
+
+
+class QueryCorpus:
+    """
+    Read-only view on a packed query corpus (see `build_corpus`).
+
+    The corpus file is memory-mapped, such that looking up a query is a slice
+    of the mapping instead of opening and reading a file.
+    """
+
+    def __init__(self, corpus_filepath=CORPUS_FILEPATH, index_filepath=CORPUS_INDEX_FILEPATH):
+        with open(index_filepath, "r") as index_file:
+            self.index = json.load(index_file)
+        with open(corpus_filepath, "rb") as corpus_file:
+            self._mmap = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def __contains__(self, filepath):
+        return os.path.normpath(filepath) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_bytes(self, filepath):
+        """
+        The query as a zero-copy view on the mapped corpus.
+        """
+        offset, length = self.index[os.path.normpath(filepath)]
+        return self._view[offset : offset + length]
+
+    def get(self, filepath):
+        return str(self.get_bytes(filepath), "utf-8")
+
+    def list_dir(self, dir_path):
+        """
+        The filepaths of the queries directly in `dir_path`, sorted.
+        """
+        dir_path = os.path.normpath(dir_path)
+        return [
+            filepath
+            for filepath in self.index
+            if os.path.dirname(filepath) == dir_path
+        ]
+
+    def get_sub_directories(self, dir_path):
+        dir_path = os.path.normpath(dir_path)
+        return sorted(
+            {
+                os.path.dirname(filepath)
+                for filepath in self.index
+                if os.path.dirname(os.path.dirname(filepath)) == dir_path
+            }
+        )
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+
+# The corpus of the current process, opened on first use
+_corpus = None
+
+
+def get_corpus():
+    """
+    The packed benchmark corpus, or None if it hasn't been built yet.
+    """
+    global _corpus
+    if _corpus is None and os.path.exists(CORPUS_INDEX_FILEPATH):
+        _corpus = QueryCorpus()
+    return _corpus
+
+
+def read_query_file(filepath):
+    """
+    Reads a benchmark query from the packed corpus, or from disk for queries
+    that aren't part of it (e.g. an extracted benchmarks directory).
+    """
+    corpus = get_corpus()
+    if corpus is not None and filepath in corpus:
+        return corpus.get(filepath)
+    with open(filepath, "r") as file:
+        return file.read()
@@ -0,0 +1,17 @@
+from .engine import Engine, ConnectionPool, QueryError
+from .duckdb_engine import DuckDBEngine
+from .duckdb_cli_engine import DuckDBCLIEngine
+from .sqlite_engine import SQLiteEngine
+from .dbapi_engine import DBAPIEngine
+from .caching_engine import CachingEngine, ResultCache, EVICTION_POLICIES
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in [DuckDBEngine, DuckDBCLIEngine, SQLiteEngine, DBAPIEngine]
+}
+
+
+def get_engine(name, **kwargs):
+    assert name in ENGINES, f"Unknown engine {name}. Choose one of {list(ENGINES)}."
+    return ENGINES[name](**kwargs)
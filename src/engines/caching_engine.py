@@ -0,0 +1,217 @@
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from .engine import Engine
+
+
+EVICTION_POLICIES = ["lru", "lfu", "size"]
+
+
+# String literals ('' escapes a quote), quoted identifiers, or runs of comments and
+# whitespace
+SQL_TOKEN_REGEX = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?:--[^\n]*|\s)+")
+
+
+def normalize_sql(query):
+    """
+    Cache key of a query: without comments, trailing semicolons, and
+    redundant whitespace. Literals and quoted identifiers are kept as is,
+    e.g. a "--" inside a string literal doesn't start a comment.
+    """
+
+    def normalize_token(match):
+        token = match.group()
+        if token.startswith("'") or token.startswith('"'):
+            return token
+        # Comments and whitespace separate tokens
+        return " "
+
+    query = SQL_TOKEN_REGEX.sub(normalize_token, query).strip()
+    return query.rstrip(";").strip()
+
+
+class ResultCache:
+    """
+    Bounded result cache with LRU, LFU, or size-based (largest first) eviction.
+
+    Args:
+        policy (str): One of "lru", "lfu", or "size".
+        max_entries (int): Maximum number of cached results (default: unbounded).
+        max_bytes (int): Maximum total size of the cached results (default: unbounded).
+    """
+
+    def __init__(self, policy="lru", max_entries=None, max_bytes=None):
+        assert policy in EVICTION_POLICIES, f"Unknown eviction policy {policy}."
+        self.policy = policy
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (result, size in bytes, cost to compute in ms), in LRU order
+        self.entries = OrderedDict()
+        self.frequencies = dict()
+        self.num_bytes = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __reduce__(self):
+        # Other processes start with an empty cache of the same configuration
+        return (ResultCache, (self.policy, self.max_entries, self.max_bytes))
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.time_saved_ms = 0.0
+        self.peak_bytes = self.num_bytes
+
+    def clear(self):
+        with self._lock:
+            self.entries = OrderedDict()
+            self.frequencies = dict()
+            self.num_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            self.frequencies[key] += 1
+            result, _, cost_ms = self.entries[key]
+            self.time_saved_ms += cost_ms
+            return result
+
+    def put(self, key, result, num_bytes, cost_ms):
+        with self._lock:
+            if key in self.entries or (
+                self.max_bytes is not None and num_bytes > self.max_bytes
+            ):
+                return
+            self.entries[key] = (result, num_bytes, cost_ms)
+            self.frequencies[key] = 1
+            self.num_bytes += num_bytes
+            while self._is_full():
+                self._evict(exclude=key)
+            self.peak_bytes = max(self.peak_bytes, self.num_bytes)
+
+    def _is_full(self):
+        return (
+            self.max_entries is not None and len(self.entries) > self.max_entries
+        ) or (self.max_bytes is not None and self.num_bytes > self.max_bytes)
+
+    def _evict(self, exclude):
+        # Only evict the new entry if it is the only one
+        candidates = [key for key in self.entries if key != exclude] or [exclude]
+        if self.policy == "lru":
+            # The entries are kept in LRU order
+            victim = candidates[0]
+        elif self.policy == "lfu":
+            # min() keeps the first, i.e. least recently used, key on ties
+            victim = min(candidates, key=lambda key: self.frequencies[key])
+        else:
+            victim = max(candidates, key=lambda key: self.entries[key][1])
+        self.num_bytes -= self.entries.pop(victim)[1]
+        del self.frequencies[victim]
+        self.evictions += 1
+
+
+class CachedResult:
+    def __init__(self, result):
+        self.result = result
+
+
+class PendingResult:
+    def __init__(self, key, handle, start_ns):
+        self.key = key
+        self.handle = handle
+        self.start_ns = start_ns
+
+
+class CachingEngine(Engine):
+    """
+    Result cache in front of another engine, keyed on the normalized query text.
+
+    This is a reference optimization for Redbench: it answers every repeated
+    query from the cache and thus bounds what exploiting query repetition can save.
+    Results are cached as Arrow tables if the wrapped engine supports them.
+    Prepared statements are cached on the query they were prepared from.
+    """
+
+    name = "cache"
+
+    def __init__(self, engine, cache):
+        super().__init__(db_filepath=engine.db_filepath)
+        self.engine = engine
+        self.cache = cache
+        self.name = f"{engine.name}+{cache.policy}_cache"
+        self.supports_arrow = engine.supports_arrow
+        self.supports_concurrency = engine.supports_concurrency
+        self.supports_interrupt = engine.supports_interrupt
+        self.interrupt_keeps_session = engine.interrupt_keeps_session
+        self.supports_prepare = engine.supports_prepare
+        self.supports_memory_reporting = engine.supports_memory_reporting
+        # Cache hits don't run the query, i.e., they'd report the previous query's profile
+        self.supports_profiling = False
+        # (connection id, statement name) -> cache key of the prepared query
+        self.prepared_keys = dict()
+
+    def connect(self):
+        return self.engine.connect()
+
+    def execute(self, con, query):
+        key = normalize_sql(query)
+        result = self.cache.get(key)
+        if result is not None:
+            return CachedResult(result)
+        start_ns = time.perf_counter_ns()
+        return PendingResult(key, self.engine.execute(con, query), start_ns)
+
+    def prepare(self, con, name, query):
+        self.engine.prepare(con, name, query)
+        self.prepared_keys[(id(con), name)] = normalize_sql(query)
+
+    def execute_prepared(self, con, name):
+        key = self.prepared_keys[(id(con), name)]
+        result = self.cache.get(key)
+        if result is not None:
+            return CachedResult(result)
+        start_ns = time.perf_counter_ns()
+        return PendingResult(key, self.engine.execute_prepared(con, name), start_ns)
+
+    def fetch(self, handle):
+        if isinstance(handle, CachedResult):
+            return handle.result
+        if self.supports_arrow:
+            result = self.engine.fetch_arrow(handle.handle)
+            num_bytes = result.nbytes
+        else:
+            result = self.engine.fetch(handle.handle)
+            num_bytes = sys.getsizeof(result) + sum(map(sys.getsizeof, result))
+        cost_ms = (time.perf_counter_ns() - handle.start_ns) / 1e6
+        self.cache.put(handle.key, result, num_bytes, cost_ms)
+        return result
+
+    def fetch_arrow(self, handle):
+        return self.fetch(handle)
+
+    def interrupt(self, con):
+        self.engine.interrupt(con)
+
+    def get_pid(self, con):
+        return self.engine.get_pid(con)
+
+    def get_memory_usage(self, con):
+        return self.engine.get_memory_usage(con)
+
+    def close(self, con):
+        self.prepared_keys = {
+            key: value
+            for key, value in self.prepared_keys.items()
+            if key[0] != id(con)
+        }
+        self.engine.close(con)
+
+    def get_version(self):
+        return self.engine.get_version()
@@ -0,0 +1,47 @@
+import importlib
+from .engine import Engine
+
+
+class DBAPIEngine(Engine):
+    """
+    Any database driver implementing the Python DB-API (PEP 249).
+
+    Args:
+        driver (str): The driver module, e.g. "psycopg2".
+        dsn (str): The argument passed to the driver's connect(), e.g. "dbname=imdb".
+    """
+
+    name = "dbapi"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.driver = kwargs.get("driver", None)
+        self.dsn = kwargs.get("dsn", None)
+        assert self.driver is not None, "Please provide the DB-API driver module."
+        # threadsafety >= 1: threads may share the module, but not connections
+        self.supports_concurrency = (
+            getattr(self._get_driver(), "threadsafety", 0) >= 1
+        )
+
+    def _get_driver(self):
+        return importlib.import_module(self.driver)
+
+    def connect(self):
+        return self._get_driver().connect(self.dsn)
+
+    def execute(self, con, query):
+        cursor = con.cursor()
+        cursor.execute(query)
+        return cursor
+
+    def fetch(self, handle):
+        try:
+            return handle.fetchall()
+        finally:
+            handle.close()
+
+    def close(self, con):
+        con.close()
+
+    def get_version(self):
+        return getattr(self._get_driver(), "__version__", None)
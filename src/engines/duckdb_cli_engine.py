@@ -0,0 +1,121 @@
+import csv
+import os
+import re
+import subprocess
+from .engine import Engine, QueryError
+from ..utils import IMDB_DB_FILEPATH, get_duckdb_version
+
+
+DEFAULT_DUCKDB_CLI = os.path.expanduser("~/.duckdb/cli/latest/duckdb")
+
+# Printed by the CLI after every query to mark the end of its output
+END_OF_RESULT_MARKER = "__REDBENCH_END_OF_RESULT__"
+# e.g. "Catalog Error: Table with name ... does not exist!"
+ERROR_REGEX = re.compile(r"^[A-Z][A-Za-z ]*Error: ")
+
+
+class DuckDBCLIConnection:
+    """
+    A long-running CLI process and the session setup to replay when it gets
+    restarted, e.g. after a query was interrupted by killing the process.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.setup_queries = []
+
+
+class DuckDBCLIEngine(Engine):
+    """
+    DuckDB through its command line binary.
+
+    Every connection is one long-running CLI process that reads queries from
+    its stdin, such that process spawn and database open aren't part of the
+    query latencies. Queries are interrupted by killing the process, which
+    is restarted on the next query of the connection.
+    """
+
+    name = "duckdb_cli"
+    supports_interrupt = True
+    interrupt_keeps_session = False
+    supports_profiling = True
+    supports_prepare = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db_filepath = self.db_filepath or IMDB_DB_FILEPATH
+        self.duckdb_cli = kwargs.get("duckdb_cli", None) or DEFAULT_DUCKDB_CLI
+
+    def _start_process(self):
+        return subprocess.Popen(
+            [self.duckdb_cli, "-readonly", "-csv", "-noheader", self.db_filepath],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+
+    def connect(self):
+        return DuckDBCLIConnection(self._start_process())
+
+    def _restart(self, con):
+        con.process.wait()
+        con.process = self._start_process()
+        for query in con.setup_queries:
+            self.fetch(self._execute(con, query))
+
+    def execute(self, con, query):
+        if con.process.poll() is not None:
+            self._restart(con)
+        return self._execute(con, query)
+
+    def _execute(self, con, query):
+        query = query.strip().rstrip(";")
+        con.process.stdin.write(f"{query};\n.print {END_OF_RESULT_MARKER}\n")
+        con.process.stdin.flush()
+        lines = []
+        while True:
+            line = con.process.stdout.readline()
+            if line == "":
+                # Restarted on the next query
+                con.process.wait()
+                raise QueryError("The DuckDB CLI process exited unexpectedly.")
+            if line.rstrip("\n") == END_OF_RESULT_MARKER:
+                break
+            lines.append(line)
+        if len(lines) > 0 and ERROR_REGEX.match(lines[0]):
+            raise QueryError("".join(lines).strip())
+        return lines
+
+    def fetch(self, handle):
+        return [tuple(row) for row in csv.reader(handle)]
+
+    def prepare(self, con, name, query):
+        self.fetch(self.execute(con, f"PREPARE {name} AS {query.strip().rstrip(';')}"))
+
+    def execute_prepared(self, con, name):
+        return self.execute(con, f"EXECUTE {name}")
+
+    def enable_profiling(self, con, profile_filepath):
+        con.setup_queries = [
+            "PRAGMA enable_profiling='json'",
+            f"PRAGMA profiling_output='{profile_filepath}'",
+        ]
+        for query in con.setup_queries:
+            self.run(con, query)
+
+    def interrupt(self, con):
+        # The CLI has no way to cancel a query through its stdin
+        con.process.kill()
+
+    def get_pid(self, con):
+        return con.process.pid
+
+    def close(self, con):
+        if con.process.poll() is None:
+            con.process.stdin.close()
+        con.process.wait()
+
+    def get_version(self):
+        return get_duckdb_version(self.duckdb_cli)
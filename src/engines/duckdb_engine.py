@@ -0,0 +1,57 @@
+import duckdb
+from .engine import Engine
+from ..utils import IMDB_DB_FILEPATH
+
+
+class DuckDBEngine(Engine):
+    """
+    In-process DuckDB through its Python client.
+    """
+
+    name = "duckdb"
+    supports_arrow = True
+    supports_interrupt = True
+    supports_profiling = True
+    supports_prepare = True
+    supports_memory_reporting = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db_filepath = self.db_filepath or IMDB_DB_FILEPATH
+
+    def connect(self):
+        return duckdb.connect(self.db_filepath, read_only=True)
+
+    def execute(self, con, query):
+        return con.execute(query)
+
+    def fetch(self, handle):
+        return handle.fetchall()
+
+    def fetch_arrow(self, handle):
+        return handle.fetch_arrow_table()
+
+    def prepare(self, con, name, query):
+        self.fetch(self.execute(con, f"PREPARE {name} AS {query.strip().rstrip(';')}"))
+
+    def execute_prepared(self, con, name):
+        return self.execute(con, f"EXECUTE {name}")
+
+    def interrupt(self, con):
+        con.interrupt()
+
+    def enable_profiling(self, con, profile_filepath):
+        self.run(con, "PRAGMA enable_profiling='json'")
+        self.run(con, f"PRAGMA profiling_output='{profile_filepath}'")
+
+    def get_memory_usage(self, con):
+        # All in-process connections to the database share its buffer manager
+        return self.run(
+            con, "SELECT sum(memory_usage_bytes) FROM duckdb_memory()"
+        )[0][0]
+
+    def close(self, con):
+        con.close()
+
+    def get_version(self):
+        return duckdb.__version__
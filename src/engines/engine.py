@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+import os
+from contextlib import contextmanager
+import queue
+import threading
+
+
+class QueryError(Exception):
+    """
+    Raised by adapters that don't surface query errors as Python exceptions themselves.
+    """
+
+
+class Engine(ABC):
+    """
+    Adapter between the Redbench runner and a database system.
+
+    Adapters only hold their configuration, never open connections, such that
+    they can be shipped to other processes. Subclasses declare what they
+    support through the capability flags below.
+    """
+
+    name = None
+    # Whether `fetch_arrow` returns query results as Arrow tables
+    supports_arrow = False
+    # Whether several connections can run queries at the same time
+    supports_concurrency = True
+    # Whether a running query can be interrupted from another thread
+    supports_interrupt = False
+    # Whether a connection keeps its session state (e.g. prepared statements)
+    # when one of its queries gets interrupted
+    interrupt_keeps_session = True
+    # Whether per-query operator profiles can be written to a file
+    supports_profiling = False
+    # Whether queries can be prepared once and executed repeatedly
+    supports_prepare = False
+    # Whether the engine reports its own memory usage (see `get_memory_usage`)
+    supports_memory_reporting = False
+
+    def __init__(self, **kwargs):
+        self.db_filepath = kwargs.get("db_filepath", None)
+
+    @abstractmethod
+    def connect(self):
+        assert False, "Not implemented"
+
+    @abstractmethod
+    def execute(self, con, query):
+        """
+        Runs `query` on `con` and returns a handle to fetch its result from.
+        """
+        assert False, "Not implemented"
+
+    @abstractmethod
+    def fetch(self, handle):
+        """
+        Returns all result rows of an executed query.
+        """
+        assert False, "Not implemented"
+
+    @abstractmethod
+    def close(self, con):
+        assert False, "Not implemented"
+
+    def fetch_arrow(self, handle):
+        assert False, f"{self.name} does not support Arrow results"
+
+    def enable_profiling(self, con, profile_filepath):
+        """
+        Makes `con` write the JSON profile of every query to `profile_filepath`.
+        """
+        assert False, f"{self.name} does not support profiling"
+
+    def prepare(self, con, name, query):
+        """
+        Parses and plans `query` once as the prepared statement `name` of `con`.
+        """
+        assert False, f"{self.name} does not support prepared statements"
+
+    def execute_prepared(self, con, name):
+        assert False, f"{self.name} does not support prepared statements"
+
+    def interrupt(self, con):
+        """
+        Cancels the query currently running on `con`, called from another thread.
+        """
+        assert False, f"{self.name} does not support interrupting queries"
+
+    def get_pid(self, con):
+        """
+        The process executing the queries of `con`, whose resource usage we sample.
+        """
+        return os.getpid()
+
+    def get_memory_usage(self, con):
+        """
+        Memory currently used by the engine in bytes, asked on a dedicated connection.
+        """
+        assert False, f"{self.name} does not report its memory usage"
+
+    def run(self, con, query):
+        return self.fetch(self.execute(con, query))
+
+    def get_version(self):
+        return None
+
+    def pool(self, size):
+        return ConnectionPool(self, size)
+
+
+class ConnectionPool:
+    """
+    Hands out at most `size` connections of an engine, reusing released ones.
+    """
+
+    def __init__(self, engine, size):
+        self.engine = engine
+        self.size = size
+        self.connections = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self.connections) < self.size:
+                con = self.engine.connect()
+                self.connections.append(con)
+                return con
+        # All connections are in use -> wait for one to be released
+        return self._idle.get()
+
+    def release(self, con):
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self):
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    def close(self):
+        for con in self.connections:
+            self.engine.close(con)
+        self.connections = []
+        self._idle = queue.Queue()
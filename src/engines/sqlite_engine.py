@@ -0,0 +1,32 @@
+import sqlite3
+from .dbapi_engine import DBAPIEngine
+
+
+DEFAULT_SQLITE_DB_FILEPATH = "imdb/db.sqlite"
+
+
+class SQLiteEngine(DBAPIEngine):
+    """
+    SQLite through the sqlite3 module of the Python standard library.
+    The IMDb database has to be loaded into `db_filepath` beforehand.
+    """
+
+    name = "sqlite"
+    supports_interrupt = True
+
+    def __init__(self, **kwargs):
+        kwargs["driver"] = "sqlite3"
+        super().__init__(**kwargs)
+        self.db_filepath = self.db_filepath or DEFAULT_SQLITE_DB_FILEPATH
+
+    def connect(self):
+        # Read-only, and usable from the thread that acquires it from a pool
+        return sqlite3.connect(
+            f"file:{self.db_filepath}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def interrupt(self, con):
+        con.interrupt()
+
+    def get_version(self):
+        return sqlite3.sqlite_version
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+from .corpus import read_query_file
+
+
+# Bump whenever generating or unpacking produces different outputs for the same inputs
+GENERATOR_VERSION = 2
+
+MANIFEST_FILEPATH = "workloads/manifest.json"
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_table(db, table_name):
+    """
+    Order-independent fingerprint of a table's content, computed inside DuckDB.
+    """
+    num_rows, row_hash_sum = db.execute(
+        f"SELECT count(*), sum(hash(t)::HUGEINT)::VARCHAR FROM {table_name} t"
+    ).fetchone()
+    return f"{num_rows}:{row_hash_sum}"
+
+
+def get_workload_inputs(csv_filepath):
+    """
+    The inputs of everything built from a workload csv file: the csv file
+    itself and the content of every query file it refers to.
+    """
+    query_filepaths = dict()
+    with open(csv_filepath, "r") as csv_file:
+        # Skip the header
+        next(csv_file, None)
+        for line in csv_file:
+            if line.strip():
+                query_filepaths[line.split(",")[0]] = None
+    queries_digest = hashlib.sha256()
+    for query_filepath in query_filepaths:
+        queries_digest.update(query_filepath.encode())
+        queries_digest.update(read_query_file(query_filepath).encode())
+    return {"csv": hash_file(csv_filepath), "queries": queries_digest.hexdigest()}
+
+
+class Manifest:
+    """
+    Records the content hashes of the inputs every output was built from,
+    such that we only rebuild the outputs whose inputs changed.
+
+    Outputs are keyed by their filepath, or by a name for outputs spanning
+    several files. The generator version is part of every output's inputs.
+    """
+
+    def __init__(self, filepath=MANIFEST_FILEPATH):
+        self.filepath = filepath
+        self.outputs = dict()
+        if os.path.exists(filepath):
+            with open(filepath, "r") as file:
+                self.outputs = json.load(file)["outputs"]
+
+    def _with_version(self, inputs):
+        return dict(inputs, generator_version=GENERATOR_VERSION)
+
+    def is_up_to_date(self, output, inputs):
+        """
+        Whether `output` was built from exactly `inputs` and all of its files still exist.
+        """
+        entry = self.outputs.get(output)
+        return (
+            entry is not None
+            and entry["inputs"] == self._with_version(inputs)
+            and all(map(os.path.exists, entry["files"]))
+        )
+
+    def record(self, output, inputs, filepaths=None):
+        """
+        Records that `output`, consisting of `filepaths` (default: the output
+        itself), was built from `inputs`.
+        """
+        self.outputs[output] = {
+            "inputs": self._with_version(inputs),
+            "files": filepaths or [output],
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        with open(f"{self.filepath}.tmp", "w") as file:
+            json.dump({"outputs": self.outputs}, file, indent=2, sort_keys=True)
+        os.replace(f"{self.filepath}.tmp", self.filepath)
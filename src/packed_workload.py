@@ -0,0 +1,126 @@
+import os
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from .utils import log, get_sub_directories
+from .corpus import read_query_file
+from .manifest import Manifest, get_workload_inputs
+
+
+# <workload_type>.arrow holds the per-query columns as an uncompressed Arrow IPC
+# file, with the query as an int32 index into the deduplicated queries of
+# <workload_type>.dictionary.parquet
+PACKED_WORKLOAD_SUFFIX = ".arrow"
+DICTIONARY_SUFFIX = ".dictionary.parquet"
+# Per-query columns of the workload csv files besides the filepath
+COLUMN_TYPES = {
+    "num_joins_in_user_query": pa.int32(),
+    "num_joins_in_benchmark_query": pa.int32(),
+    "query_id": pa.int64(),
+    "arrival_timestamp": pa.timestamp("us"),
+}
+
+
+def get_dictionary_filepath(filepath):
+    return filepath[: -len(PACKED_WORKLOAD_SUFFIX)] + DICTIONARY_SUFFIX
+
+
+def pack_workload(csv_filepath):
+    """
+    Converts a workload csv file into a packed workload next to it: every
+    distinct query once in the dictionary file, and the workload as columnar
+    arrays with an int32 column `query_idx` into the dictionary.
+    Returns the number of queries of the workload.
+    """
+    dictionary = dict()
+    query_idxs = []
+    with open(csv_filepath, "r") as csv_file:
+        header = csv_file.readline().strip().split(",")
+        columns = {column: [] for column in header[1:] if column in COLUMN_TYPES}
+        for line in csv_file:
+            if not line.strip():
+                continue
+            row = dict(zip(header, line.strip().split(",")))
+            query_filepath = row["filepath"]
+            if query_filepath not in dictionary:
+                dictionary[query_filepath] = len(dictionary)
+            query_idxs.append(dictionary[query_filepath])
+            for column, values in columns.items():
+                values.append(row[column])
+
+    filepath = csv_filepath[: -len(".csv")] + PACKED_WORKLOAD_SUFFIX
+    pq.write_table(
+        pa.table(
+            {
+                "filepath": list(dictionary),
+                "query": [read_query_file(query_filepath).strip() for query_filepath in dictionary],
+            }
+        ),
+        get_dictionary_filepath(filepath),
+    )
+    table = {"query_idx": pa.array(query_idxs, type=pa.int32())}
+    for column, values in columns.items():
+        table[column] = pa.array(values).cast(COLUMN_TYPES[column])
+    # A single uncompressed record batch (also for empty workloads), such that
+    # every column is one contiguous array that can be used straight from the mapping
+    batch = pa.record_batch(table)
+    with ipc.new_file(filepath, batch.schema) as writer:
+        writer.write_batch(batch)
+    return len(query_idxs)
+
+
+class PackedWorkload:
+    """
+    Read-only view on a packed workload (see `pack_workload`).
+
+    The per-query columns are memory-mapped, and exposed as zero-copy numpy
+    views on the mapping. Every distinct query text is materialized only
+    once, no matter how often the workload repeats it.
+    """
+
+    def __init__(self, filepath):
+        dictionary = pq.read_table(get_dictionary_filepath(filepath))
+        self.filepaths = dictionary.column("filepath").to_pylist()
+        self.queries = dictionary.column("query").to_pylist()
+        self.batch = ipc.open_file(pa.memory_map(filepath, "r")).get_batch(0)
+
+    def __len__(self):
+        return self.batch.num_rows
+
+    def __iter__(self):
+        """
+        Yields (query_filepath, query) in workload order.
+        """
+        for query_idx in self["query_idx"]:
+            yield self.filepaths[query_idx], self.queries[query_idx]
+
+    def __getitem__(self, column):
+        return self.batch.column(column).to_numpy(zero_copy_only=True)
+
+
+def pack_workloads(workloads_dir, override=False):
+    """
+    Packs every workload csv file of the query repetition buckets in
+    `workloads_dir`, skipping those that are up to date (see manifest.py).
+    """
+    manifest = Manifest()
+    num_workloads, num_queries, num_up_to_date = 0, 0, 0
+    for subdir in sorted(get_sub_directories(workloads_dir)):
+        for filename in sorted(os.listdir(subdir)):
+            if not filename.endswith(".csv") or filename == "stats.csv":
+                continue
+            csv_filepath = os.path.join(subdir, filename)
+            filepath = csv_filepath[: -len(".csv")] + PACKED_WORKLOAD_SUFFIX
+            inputs = get_workload_inputs(csv_filepath)
+            if not override and manifest.is_up_to_date(filepath, inputs):
+                num_up_to_date += 1
+                continue
+            num_queries += pack_workload(csv_filepath)
+            num_workloads += 1
+            manifest.record(
+                filepath, inputs, [filepath, get_dictionary_filepath(filepath)]
+            )
+    manifest.save()
+    log(
+        f"Finished packing {num_workloads} Redbench workloads ({num_queries} queries), {num_up_to_date} already up to date."
+    )
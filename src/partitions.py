@@ -0,0 +1,98 @@
+import os
+import glob
+import tempfile
+import multiprocessing
+import duckdb
+from concurrent.futures import ProcessPoolExecutor
+
+
+PARTITION_KEY = "instance_id"
+
+
+def _run_partition(fn, input_table, output_table, input_dir_path, output_filepath, threads):
+    # Runs in a worker process, on a private in-memory database
+    db = duckdb.connect(config={"threads": threads})
+    db.execute(
+        f"""
+        CREATE TABLE {input_table} AS
+        SELECT * FROM read_parquet('{input_dir_path}/*.parquet', hive_partitioning = false)
+    """
+    )
+    fn(db)
+    column_types = db.execute(
+        f"""
+        SELECT column_name, data_type
+        FROM duckdb_columns()
+        WHERE table_name = '{output_table}'
+        ORDER BY column_index
+    """
+    ).fetchall()
+    # Parquet has no HUGEINT, e.g. of sum(BIGINT) -> as a decimal instead of a lossy double
+    columns = [
+        f'"{column}"::DECIMAL(38, 0) AS "{column}"' if column_type == "HUGEINT" else f'"{column}"'
+        for column, column_type in column_types
+    ]
+    db.execute(
+        f"COPY (SELECT {', '.join(columns)} FROM {output_table}) TO '{output_filepath}' (FORMAT PARQUET)"
+    )
+    db.close()
+    return column_types
+
+
+def run_partitioned(
+    db, input_table, output_table, fn, num_partitions, num_workers=None
+):
+    """
+    Runs `fn` separately on every hash partition of `input_table` by
+    instance_id (the Redset cluster), on a pool of `num_workers` processes,
+    and merges the results into `output_table` of `db`, with the column
+    types `fn` produced.
+
+    `fn(partition_db)` gets a private in-memory database holding the
+    partition as table `input_table`, and must create `output_table` in it.
+    It must be picklable, e.g. a module-level function or a partial of one,
+    and must only relate rows of the same cluster, e.g. of the same user.
+    """
+    num_workers = num_workers or min(num_partitions, os.cpu_count())
+    # Split the cores among the workers
+    threads = max(1, os.cpu_count() // num_workers)
+    with tempfile.TemporaryDirectory(prefix="partitions_", dir=".") as dir_path:
+        db.execute(
+            f"""
+            COPY (
+                SELECT *, hash({PARTITION_KEY}) % {num_partitions} AS partition_id
+                FROM {input_table}
+            ) TO '{dir_path}/input' (FORMAT PARQUET, PARTITION_BY (partition_id))
+        """
+        )
+        # Empty partitions have no directory
+        input_dir_paths = sorted(glob.glob(f"{dir_path}/input/partition_id=*"))
+        assert len(input_dir_paths) > 0, f"Table {input_table} is empty"
+        output_filepaths = [
+            f"{dir_path}/output_{i}.parquet" for i in range(len(input_dir_paths))
+        ]
+        # Don't fork the multi-threaded DuckDB of this process
+        with ProcessPoolExecutor(
+            max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            column_types = list(
+                executor.map(
+                    _run_partition,
+                    [fn] * len(input_dir_paths),
+                    [input_table] * len(input_dir_paths),
+                    [output_table] * len(input_dir_paths),
+                    input_dir_paths,
+                    output_filepaths,
+                    [threads] * len(input_dir_paths),
+                )
+            )
+        # The same types as without partitioning
+        columns = [
+            f'"{column}"::{column_type} AS "{column}"' for column, column_type in column_types[0]
+        ]
+        db.execute(
+            f"""
+            CREATE OR REPLACE TABLE {output_table} AS
+            SELECT {', '.join(columns)} FROM read_parquet({output_filepaths})
+        """
+        )
@@ -0,0 +1,56 @@
+import json
+
+
+# Broad operator categories of DuckDB's physical operators, checked in order
+OPERATOR_CATEGORIES = [
+    ("hash join", lambda operator_type: operator_type == "HASH_JOIN"),
+    ("join", lambda operator_type: "JOIN" in operator_type),
+    ("scan", lambda operator_type: "SCAN" in operator_type),
+    ("filter", lambda operator_type: operator_type == "FILTER"),
+    (
+        "aggregate",
+        lambda operator_type: "AGGREGATE" in operator_type
+        or "GROUP_BY" in operator_type,
+    ),
+    ("projection", lambda operator_type: operator_type == "PROJECTION"),
+]
+
+
+def get_operator_category(operator_type):
+    for category, matches in OPERATOR_CATEGORIES:
+        if matches(operator_type):
+            return category
+    return "other"
+
+
+def read_profile(profile_filepath):
+    with open(profile_filepath, "r") as file:
+        return json.load(file)
+
+
+def parse_profile_operators(profile):
+    """
+    Flattens a DuckDB JSON profile into one record per physical operator
+    (operator_id in pre-order, depth in the plan, type, category, timing, cardinality).
+    """
+    operators = []
+
+    def visit(node, depth):
+        if "operator_type" in node:
+            operators.append(
+                {
+                    "operator_id": len(operators),
+                    "depth": depth,
+                    "operator_type": node["operator_type"],
+                    "operator_category": get_operator_category(node["operator_type"]),
+                    "operator_timing_ms": node.get("operator_timing", 0.0) * 1e3,
+                    "operator_cardinality": node.get("operator_cardinality", 0),
+                    "operator_rows_scanned": node.get("operator_rows_scanned", 0),
+                }
+            )
+            depth += 1
+        for child in node.get("children", []):
+            visit(child, depth)
+
+    visit(profile, 0)
+    return operators
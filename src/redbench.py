@@ -3,7 +3,10 @@ from matplotlib.lines import Line2D
 import random
 import os
 import copy
+import json
 from .utils import *
+from .manifest import Manifest, hash_bytes, hash_table
+from .packed_workload import PACKED_WORKLOAD_SUFFIX, PackedWorkload
 import numpy as np
 
 
@@ -27,6 +30,7 @@ class Redbench:
         stat_2_name,
         title,
         draw_line=False,
+        medians=None,
     ):
         os.makedirs(f"figures/redbench/{dir_name}", exist_ok=True)
         plt.scatter(
@@ -45,6 +49,9 @@ class Redbench:
                 color="black",
                 linestyle="--",
             )
+        if medians is not None:
+            plt.axvline(medians[0], color="gray", linestyle=":", label="group median")
+            plt.axhline(medians[1], color="gray", linestyle=":")
 
         plt.xlabel(stats_1_name)
         plt.ylabel(stat_2_name)
@@ -56,28 +63,20 @@ class Redbench:
         plt.close()
 
     def _sample_users(self):
-        repetition_rates = [(hi / 100 - 0.1, hi / 100) for hi in range(10, 101, 10)]
-        sampled_users = dict()  # group id -> list of the 5 user's stats
-        for rep_lo, rep_hi in repetition_rates:
-            group_id = f"{int(rep_lo * 100)}%-{int(rep_hi * 100)}%"
-            users_list = (
-                self.db.execute(
-                    f"""
-                    select
-                        *,
-                        '{group_id}' as group_id,
-                        rank() over (order by num_distinct_num_joins asc) as rank_1,
-                        rank() over (order by num_distinct_readsets asc) as rank_2,
-                        rank_1 + rank_2 as variability
-                    from user_stats
-                    where
-                        query_repetition_rate between {rep_lo} and {rep_hi}
-                    order by variability, user_key asc
-                """
-                )
-                .fetchdf()
-                .to_dict(orient="records")
-            )
+        sampled_users = dict()  # group id -> list of the 3 user's stats
+        # The users of every query repetition bucket, by increasing variability (see UserStats)
+        for (
+            group_id,
+            num_joins_quartiles,
+            readsets_quartiles,
+            users,
+        ) in self.db.execute(
+            """
+            select group_id, num_distinct_num_joins_quartiles, num_distinct_readsets_quartiles, users
+            from user_stats_by_bucket order by bucket
+        """
+        ).fetchall():
+            users_list = [dict(user, group_id=group_id) for user in users]
             sample = (users_list[0], users_list[len(users_list) // 2], users_list[-1])
             sample[0]["workload_type"] = "low_variability"
             sample[1]["workload_type"] = "mid_variability"
@@ -104,6 +103,7 @@ class Redbench:
                 "Number of distinct num_joins",
                 "Number of distinct readsets",
                 f"Number of distinct num_joins and readsets for each user in the group {group_id}",
+                medians=(num_joins_quartiles[2], readsets_quartiles[2]),
             )
             sampled_users[group_id] = sample
         return sampled_users
@@ -122,14 +122,35 @@ class Redbench:
             )
         )
 
+    def _get_generation_inputs(self, benchmark_stats):
+        # The sampling draws from one random sequence across all users, so the
+        # workloads can only be regenerated all together
+        return {
+            "benchmark_stats": hash_bytes(
+                json.dumps(benchmark_stats, sort_keys=True, default=str).encode()
+            ),
+            "user_stats": hash_table(self.db, "user_stats_by_bucket"),
+            "redset": hash_table(self.db, "redset"),
+        }
+
+    def _get_generated_filepaths(self):
+        return [
+            os.path.join(subdir, filename)
+            for subdir in get_sub_directories(WORKLOADS_DIR)
+            for filename in os.listdir(subdir)
+            if filename.endswith(".csv")
+        ]
+
     def generate(self, override=True):
         random.seed(0)
-        if not override and self.exists():
-            log("Redbench already generated.")
+        benchmark_stats = self.benchmark.get_stats()
+        manifest = Manifest()
+        inputs = self._get_generation_inputs(benchmark_stats)
+        if not override and manifest.is_up_to_date("generate", inputs):
+            log("Redbench already generated from the same inputs.")
             return
         os.system("rm -rf {WORKLOADS_DIR}")
         log("Generating Redbench..")
-        benchmark_stats = self.benchmark.get_stats()
         self.num_joins_to_ceb_queries = map_num_joins_to_ceb_queries(benchmark_stats)
         self.ceb_template_to_ceb_queries = map_ceb_template_to_ceb_queries(
             benchmark_stats
@@ -142,6 +163,8 @@ class Redbench:
             for user in users_sample:
                 self._sample_benchmark_for_user(user, sampling_stats)
             self._dump_sampling_stats(group_id, users_sample, sampling_stats)
+        manifest.record("generate", inputs, self._get_generated_filepaths())
+        manifest.save()
         # Generate plots for the resulting 30 workloads
         self._plot_workloads()
         log("Finished generating Redbench.")
@@ -184,7 +207,7 @@ class Redbench:
             assert benchmark_query is not None
 
             sampled_benchmark.append(
-                f"{benchmark_query},{old_num_joins},{num_joins},{user_query['query_id']}"
+                f"{benchmark_query},{old_num_joins},{num_joins},{user_query['query_id']},{user_query['arrival_timestamp']}"
             )
             sampling_stats[user_stats["user_key"]]["num_queries"] = len(
                 sampled_benchmark
@@ -351,7 +374,7 @@ class Redbench:
     def _write_benchmark_file_to_disk(self, user_stats, sampled_benchmark):
         dir_path = f"{WORKLOADS_DIR}/{user_stats['group_id']}"
         csv_header = (
-            "filepath,num_joins_in_user_query,num_joins_in_benchmark_query,query_id\n"
+            "filepath,num_joins_in_user_query,num_joins_in_benchmark_query,query_id,arrival_timestamp\n"
         )
 
         os.makedirs(dir_path, exist_ok=True)
@@ -373,12 +396,22 @@ class Redbench:
             filename = filename.split(".")[0].replace("_", "-")
             if not filepath.endswith(".csv") or "stats.csv" in filepath:
                 continue
-            with open(filepath, "r") as file:
-                queries = file.readlines()[1:]
-            for query in queries:
-                query = query.strip().split(",")
-                data["redset"][filename].append(int(query[2]))
-                data["redbench"][filename].append(int(query[1]))
+            packed_filepath = filepath[: -len(".csv")] + PACKED_WORKLOAD_SUFFIX
+            # A packed workload is stale once `generate` rewrote the csv file
+            if os.path.exists(packed_filepath) and os.path.getmtime(
+                packed_filepath
+            ) >= os.path.getmtime(filepath):
+                # Columnar arrays instead of parsing the csv file
+                workload = PackedWorkload(packed_filepath)
+                data["redset"][filename] = workload["num_joins_in_benchmark_query"].tolist()
+                data["redbench"][filename] = workload["num_joins_in_user_query"].tolist()
+            else:
+                with open(filepath, "r") as file:
+                    queries = file.readlines()[1:]
+                for query in queries:
+                    query = query.strip().split(",")
+                    data["redset"][filename].append(int(query[2]))
+                    data["redbench"][filename].append(int(query[1]))
             # Compute cumulative average of num joins
             for target in ["redset", "redbench"]:
                 data[target][filename] = [sum(data[target][filename][:i]) / i for i in range(1, len(data[target][filename]))]
@@ -1,5 +1,11 @@
+import glob
+import json
 from .utils import *
 from .user_stats import UserStats
+from .resources import StageMonitor
+from .manifest import hash_bytes
+from .partitions import run_partitioned
+from functools import partial
 import src.benchmarks.imdb as benchmark
 
 
@@ -11,6 +17,61 @@ MAX_ALLOWED_NUM_JOINS_GAP = (
 REDSET_FILEPATH = (
     "https://s3.amazonaws.com/redshift-downloads/redset/provisioned/full.parquet"
 )
+REDSET_SERVERLESS_FILEPATH = (
+    "https://s3.amazonaws.com/redshift-downloads/redset/serverless/full.parquet"
+)
+REDSET_VARIANTS = {
+    "provisioned": REDSET_FILEPATH,
+    "serverless": REDSET_SERVERLESS_FILEPATH,
+}
+# The Redset columns kept in the table 'redset'
+REDSET_COLUMNS = [
+    "instance_id",
+    "user_id",
+    "query_id",
+    "arrival_timestamp",
+    "query_type",
+    "num_joins",
+    "num_scans",
+    "read_table_ids",
+    "feature_fingerprint",
+    "execution_duration_ms",
+]
+# We keep each user's busiest period, i.e., the window with the most queries
+# starting between these timestamps, by default Monday 8am to Friday 5pm
+WINDOW_FIRST_START = "2024-03-04 08:00:00"
+WINDOW_LAST_START = "2025-01-01 00:00:00"
+WINDOW_LENGTH = "105 HOURS"
+WINDOW_STRIDE = "1 WEEK"
+
+
+def get_parquet_scan(source):
+    """
+    The DuckDB table function scanning `source`: a local Parquet file, a
+    directory of (hive-partitioned) Parquet files, a glob, or a URL.
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, "**", "*.parquet")
+    return f"read_parquet('{source}', union_by_name = true)"
+
+
+def get_source_version(source):
+    """
+    Identifies the content of `source`. Local files are identified by their
+    paths, sizes, and modification times, such that a regenerated dataset
+    (e.g. a synthetic one) gets re-ingested. Remote sources never change.
+    """
+    pattern = (
+        os.path.join(source, "**", "*.parquet") if os.path.isdir(source) else source
+    )
+    filepaths = sorted(glob.glob(pattern, recursive=True))
+    if len(filepaths) == 0:
+        return source
+    files = [
+        (filepath, os.path.getsize(filepath), os.stat(filepath).st_mtime_ns)
+        for filepath in filepaths
+    ]
+    return f"{source}#{hash_bytes(json.dumps(files).encode())}"
 
 
 class Redset:
@@ -19,12 +80,31 @@ class Redset:
 
     Args:
         db (duckdb.DuckDB): The DuckDB database used by the experiments.
-        override (bool): Whether to override the table 'redset' if exists.
-        verbose (bool): Whether to print extra stats on the Redset dataset.
+        source (str): Redset's Parquet file(s), see `get_parquet_scan` (default: the S3 URL),
+            e.g. a synthetic Redset (see `SyntheticRedset`).
+        window_length (str): The length of the users' busiest period, e.g. "105 HOURS".
+        window_stride (str): The distance between two possible starts of the busiest
+            period, e.g. "1 WEEK" or "1 HOUR". None lets it start at any query.
+        num_partitions (int): If set, the prefiltered queries are hash-partitioned by
+            cluster, and every partition is preprocessed in a separate process.
+        num_workers (int): Number of worker processes (default: one per core).
     """
 
-    def __init__(self, db):
+    def __init__(
+        self,
+        db,
+        source=REDSET_FILEPATH,
+        window_length=WINDOW_LENGTH,
+        window_stride=WINDOW_STRIDE,
+        num_partitions=None,
+        num_workers=None,
+    ):
         self.db = db
+        self.source = source
+        self.window_length = window_length
+        self.window_stride = window_stride
+        self.num_partitions = num_partitions
+        self.num_workers = num_workers
         self.user_stats = None
 
     def _is_setup(self):
@@ -39,9 +119,22 @@ class Redset:
             and self.db.execute("SELECT COUNT(*) FROM redset").fetchone()[0] > 0
         )
 
+    def _is_prefiltered(self):
+        """
+        Whether the table 'prefiltered_redset' was already ingested from the
+        current content of our source.
+        """
+        return (
+            self.db.execute(
+                "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'prefiltered_redset' AND comment = ?",
+                [get_source_version(self.source)],
+            ).fetchone()[0]
+            > 0
+        )
+
     def compute_stats(self, override=False):
         # Compute user stats
-        self.user_stats = UserStats(self.db)
+        self.user_stats = UserStats(self.db, self.num_partitions, self.num_workers)
         self.user_stats.setup(override)
 
     def setup(self, override=False):
@@ -49,93 +142,143 @@ class Redset:
         self._setup(override)
         self._dump_stats()
 
-    def _setup(self, override):
-        if not override and self._is_setup():
-            log("Redset already set up.")
+    def _prefilter(self):
+        """
+        Ingests the select queries of Redset that qualify for Redbench into the
+        table 'prefiltered_redset'.
+
+        Only the columns we use are read, and all simple filters are part of
+        the Parquet scan, such that DuckDB prunes row groups based on their
+        min/max statistics instead of copying the whole dataset first.
+        """
+        if self._is_prefiltered():
+            log(f"Redset already ingested from {self.source}.")
             return
         log(
-            f"Downloading and prefiltering Redset. This may take a few minutes..",
+            f"Downloading and prefiltering Redset from {self.source}. This may take a few minutes..",
         )
-
+        with StageMonitor(self.db, "Prefiltering Redset", "prefiltered_redset"):
+            self.db.execute(
+                f"""
+            CREATE OR REPLACE TABLE prefiltered_redset AS (
+                SELECT
+                    {", ".join(REDSET_COLUMNS)},
+                    concat(user_id, '#', instance_id) as user_key
+                FROM {get_parquet_scan(self.source)}
+                WHERE
+                    num_external_tables_accessed = 0
+                    and num_system_tables_accessed = 0
+                    and query_type = 'select'
+                    and num_joins > 0
+                    and read_table_ids is not null
+                    and was_cached = 0
+                    -- The number of read tables, i.e., the readset size
+                    and (
+                        LENGTH(read_table_ids)
+                        - LENGTH(REPLACE(read_table_ids, ',', ''))
+                        + 1
+                    ) = num_joins + 1
+            )
+        """
+            )
+        # Remember the source to re-ingest when it changes
         self.db.execute(
-            f"""
-                CREATE TABLE IF NOT EXISTS raw_redset AS (
-                    select
-                        *,
-                        concat(user_id, '#', instance_id) as user_key,
-                    from '{REDSET_FILEPATH}'
-                )
-            """
+            f"COMMENT ON TABLE prefiltered_redset IS '{get_source_version(self.source)}'"
         )
 
+    def _setup(self, override):
+        # A changed source, e.g. a regenerated synthetic Redset, is re-ingested
+        if not override and self._is_prefiltered() and self._is_setup():
+            log("Redset already set up.")
+            return
+        self._prefilter()
+        # Stats on the previous Redset are outdated
+        self.db.execute("DROP TABLE IF EXISTS user_stats")
+
+        with StageMonitor(self.db, "Selecting the busiest period per user", "redset"):
+            if self.num_partitions is None:
+                self._select_busiest_periods()
+            else:
+                run_partitioned(
+                    self.db,
+                    "prefiltered_redset",
+                    "redset",
+                    partial(
+                        _select_busiest_periods,
+                        window_length=self.window_length,
+                        window_stride=self.window_stride,
+                    ),
+                    self.num_partitions,
+                    self.num_workers,
+                )
+
+    def _select_busiest_periods(self):
+        """
+        Creates the table 'redset' from the table 'prefiltered_redset': the
+        queries of every user's busiest period, at most the first 1000 of them.
+        """
+        # The start of the busiest period's candidate right before each query
+        window_start = (
+            f"time_bucket(INTERVAL {self.window_stride}, arrival_timestamp, '{WINDOW_FIRST_START}'::timestamp)"
+            if self.window_stride is not None
+            else "arrival_timestamp"
+        )
         self.db.execute(
             f"""
             CREATE OR REPLACE TABLE redset AS (
-                with redset_1 as (
+                with timeline as MATERIALIZED (
                     SELECT
-                        *,
-                        '' as query_hash
-                    FROM raw_redset T
-                    WHERE
-                        T.num_external_tables_accessed = 0
-                        and T.num_system_tables_accessed = 0
-                        and T.query_type = 'select'
-                        and T.num_joins > 0
-                        and T.read_table_ids is not null
-                        and T.was_cached = 0
-                        and
-                        (
-                            CASE
-                                WHEN T.read_table_ids is NULL THEN 0
-                                ELSE (
-                                    LENGTH(T.read_table_ids)
-                                    - LENGTH(REPLACE(T.read_table_ids, ',', ''))
-                                    + 1
-                                )
-                            END
-                        ) = num_joins + 1
-                ), days as (
-                    SELECT generate_series as day_start
-                    from generate_series('2024-03-04 08:00:00'::timestamp, '2025-01-01'::timestamp, INTERVAL 1 WEEK)
-                ), queries_per_day as (
-                    select user_key, day_start, count(*) as num_queries
-                    from redset_1, days
-                    where arrival_timestamp >= day_start
-                        and arrival_timestamp < day_start + INTERVAL 105 HOURS
-                    group by user_key, day_start
-                ), best_day as (
-                    select queries_per_day.user_key, queries_per_day.day_start
-                    from
-                        queries_per_day,
-                        (
-                            select user_key, max(num_queries) as num_queries
-                            from queries_per_day
-                            group by user_key
-                        ) max_num_queries
-                    where
-                        max_num_queries.user_key = queries_per_day.user_key
-                        and max_num_queries.num_queries = queries_per_day.num_queries
-                        and not exists (
-                            select 1
-                            from queries_per_day qpd
-                            where qpd.user_key = queries_per_day.user_key
-                                and qpd.day_start < queries_per_day.day_start
-                                and qpd.num_queries = max_num_queries.num_queries
-                        )
+                        user_key,
+                        arrival_timestamp,
+                        ROW_NUMBER() OVER (PARTITION BY user_key ORDER BY arrival_timestamp ASC) AS position,
+                        -- The number of queries up to this one, including those at the same time
+                        COUNT(*) OVER (PARTITION BY user_key ORDER BY arrival_timestamp ASC) AS num_queries_until,
+                        {window_start} as window_start
+                    FROM prefiltered_redset
+                ), windows as (
+                    -- Only windows starting right before one of the user's queries
+                    -- are candidates: moving any other window to the next such
+                    -- start can only add queries to it
+                    select
+                        user_key,
+                        window_start,
+                        window_start + INTERVAL {self.window_length} as window_end,
+                        min(position) as first_position
+                    from timeline
+                    where window_start between '{WINDOW_FIRST_START}'::timestamp and '{WINDOW_LAST_START}'::timestamp
+                    group by user_key, window_start
+                ), queries_per_window as (
+                    -- The user's queries up to the window's end minus those before its start,
+                    -- found with the user's last query before the window ends
+                    select windows.user_key, windows.window_start, timeline.num_queries_until - windows.first_position + 1 as num_queries
+                    from windows asof join timeline
+                        on windows.user_key = timeline.user_key
+                        and windows.window_end > timeline.arrival_timestamp
+                ), best_window as MATERIALIZED (
+                    -- The window with the most queries, the earliest one on ties
+                    select user_key, window_start
+                    from (
+                        select
+                            user_key,
+                            window_start,
+                            ROW_NUMBER() OVER (PARTITION BY user_key ORDER BY num_queries DESC, window_start ASC) AS rank
+                        from queries_per_window
+                    )
+                    where rank = 1
                 ), redset_2 as (
                     SELECT T.*
-                    FROM redset_1 T, best_day
+                    FROM prefiltered_redset T, best_window
                     WHERE
-                        T.user_key = best_day.user_key
-                        and arrival_timestamp >= best_day.day_start
-                        and arrival_timestamp < best_day.day_start + INTERVAL 105 HOURS
+                        T.user_key = best_window.user_key
+                        and arrival_timestamp >= best_window.window_start
+                        and arrival_timestamp < best_window.window_start + INTERVAL {self.window_length}
                 ), ordered_queries AS (
                     SELECT 
                         user_key,
                         query_id, 
                         ROW_NUMBER() OVER (PARTITION BY user_key ORDER BY arrival_timestamp ASC) AS rank
                     FROM redset_2
-                ), redset_3 as (
+                ), redset_3 as MATERIALIZED (
                     select redset_2.*
                     from redset_2, ordered_queries
                     where redset_2.user_key = ordered_queries.user_key
@@ -149,26 +292,26 @@ class Redset:
                         max(num_joins) == min(num_joins) or
                         max(num_joins) - min(num_joins) > {MAX_ALLOWED_NUM_JOINS_GAP}
                 )
-                select *
+                select
+                    *,
+                    -- The readset is the numerically sorted list of read tables
+                    concat(
+                        feature_fingerprint, '#', num_scans, '#', num_joins, '#',
+                        array_to_string(
+                            list_sort(
+                                list_transform(
+                                    string_split(read_table_ids, ','),
+                                    table_id -> trim(table_id)::BIGINT
+                                )
+                            ),
+                            ','
+                        )
+                    ) as query_hash
                 from redset_3
                 where user_key not in (select * from eliminated_users)
             )
         """
         )
-        log("Computing Redset query readsets and hashes..")
-        queries = (
-            self.db.execute("SELECT * FROM redset").fetchdf().to_dict(orient="records")
-        )
-        for query in queries:
-            readset = ",".join(map(str, get_readset_from_user_query(query)))
-            self.db.execute(
-                f"""
-                UPDATE redset
-                SET
-                    query_hash = concat(feature_fingerprint, '#', num_scans, '#', num_joins, '#{readset}')
-                WHERE user_key = '{query["user_key"]}' AND query_id = {query["query_id"]}
-            """
-            )
 
     def _dump_stats(self):
         num_queries = self.db.execute("SELECT COUNT(*) FROM redset").fetchone()[0]
@@ -185,3 +328,10 @@ class Redset:
             self.user_stats is not None
         ), "User stats not set up. Please run setup() first."
         self.user_stats.dump_plots()
+
+
+def _select_busiest_periods(db, window_length, window_stride):
+    # Runs on a partition of the prefiltered queries, see `run_partitioned`
+    Redset(
+        db, window_length=window_length, window_stride=window_stride
+    )._select_busiest_periods()
@@ -0,0 +1,206 @@
+import os
+import time
+import threading
+from .utils import log
+
+
+CLOCK_TICKS_PER_SECOND = (
+    os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+)
+
+
+def read_process_usage(pid):
+    """
+    Reads the resource usage of a process from /proc.
+    Returns None for the stats that aren't available on this system.
+    """
+    usage = {
+        "cpu_time_ms": None,
+        "rss_bytes": None,
+        "peak_rss_bytes": None,
+        "read_bytes": None,
+        "write_bytes": None,
+        "read_syscall_bytes": None,
+        "write_syscall_bytes": None,
+    }
+    try:
+        with open(f"/proc/{pid}/stat", "r") as file:
+            # The process name may contain spaces -> split after its closing parenthesis
+            fields = file.read().rsplit(")", 1)[1].split()
+        # utime and stime are the 14th and 15th fields of /proc/<pid>/stat
+        usage["cpu_time_ms"] = (
+            (int(fields[11]) + int(fields[12])) / CLOCK_TICKS_PER_SECOND * 1e3
+        )
+        with open(f"/proc/{pid}/status", "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    usage["rss_bytes"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    usage["peak_rss_bytes"] = int(line.split()[1]) * 1024
+        with open(f"/proc/{pid}/io", "r") as file:
+            io = dict(line.split(": ") for line in file.read().splitlines())
+        usage["read_bytes"] = int(io["read_bytes"])
+        usage["write_bytes"] = int(io["write_bytes"])
+        usage["read_syscall_bytes"] = int(io["rchar"])
+        usage["write_syscall_bytes"] = int(io["wchar"])
+    except (OSError, IndexError, KeyError, ValueError):
+        pass
+    return usage
+
+
+class ResourceSampler:
+    """
+    Samples the resource usage of the process running an engine's queries in
+    a background thread, every `interval_s` seconds and at every query start.
+
+    Every sample is attributed to the query running at that time, such that
+    we can aggregate the samples per query, workload, and bucket.
+    CPU time and read/write bytes are cumulative over the process' lifetime.
+
+    Args:
+        engine (Engine): The engine running the queries.
+        con: The connection running the queries.
+        interval_s (float): Time between two samples.
+    """
+
+    def __init__(self, engine, con, interval_s=0.1):
+        self.engine = engine
+        self.con = con
+        self.interval_s = interval_s
+        self.samples = []
+        self.current_query = {"bucket": None, "workload_type": None, "position": None}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Engines that report their memory usage are asked on a separate connection
+        self._monitor_con = (
+            engine.connect() if engine.supports_memory_reporting else None
+        )
+
+    def _sample(self):
+        # Samples are taken from both the sampler and the runner thread
+        with self._lock:
+            # Asked every time, engines may restart their process, e.g. after a timeout
+            usage = read_process_usage(self.engine.get_pid(self.con))
+            usage["engine_memory_bytes"] = (
+                self.engine.get_memory_usage(self._monitor_con)
+                if self._monitor_con is not None
+                else None
+            )
+            usage.update(self.current_query)
+            usage["timestamp_ms"] = (time.perf_counter_ns() - self._start_ns) / 1e6
+            self.samples.append(usage)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def start(self):
+        self._start_ns = time.perf_counter_ns()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def mark(self, bucket_name, workload_type, position):
+        """
+        Attributes the following samples to the given query, starting with one right away.
+        """
+        with self._lock:
+            self.current_query = {
+                "bucket": bucket_name,
+                "workload_type": workload_type,
+                "position": position,
+            }
+        self._sample()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Final sample to close the last query
+        self._sample()
+        if self._monitor_con is not None:
+            with self._lock:
+                self.engine.close(self._monitor_con)
+                self._monitor_con = None
+
+
+class StageMonitor:
+    """
+    Logs the elapsed time, the rows produced, and the peak memory of a
+    pipeline stage running on the DuckDB database `db`, e.g.:
+
+        with StageMonitor(db, "Prefiltering Redset", "prefiltered_redset"):
+            db.execute("CREATE TABLE prefiltered_redset AS ...")
+
+    Memory is sampled in a background thread every `interval_s` seconds: the
+    process' RSS, the memory of DuckDB's buffer manager, and the bytes DuckDB
+    spilled to its temp directory. The latter two are asked on a separate
+    cursor, since the stage's connection is busy.
+
+    Args:
+        db (duckdb.DuckDB): The database the stage runs on.
+        name (str): The name of the stage, used in the log line.
+        table_name (str): The table produced by the stage, if any.
+        interval_s (float): Time between two samples.
+    """
+
+    def __init__(self, db, name, table_name=None, interval_s=0.1):
+        self.db = db
+        self.name = name
+        self.table_name = table_name
+        self.interval_s = interval_s
+        self.peak_rss_bytes = 0
+        self.peak_duckdb_memory_bytes = 0
+        self.peak_spilled_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._monitor_con = None
+
+    def _sample(self):
+        rss_bytes = read_process_usage(os.getpid())["rss_bytes"] or 0
+        duckdb_memory_bytes, spilled_bytes = self._monitor_con.execute(
+            """
+            SELECT
+                coalesce(sum(memory_usage_bytes), 0),
+                coalesce(sum(temporary_storage_bytes), 0)
+            FROM duckdb_memory()
+        """
+        ).fetchone()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss_bytes)
+        self.peak_duckdb_memory_bytes = max(
+            self.peak_duckdb_memory_bytes, duckdb_memory_bytes
+        )
+        self.peak_spilled_bytes = max(self.peak_spilled_bytes, spilled_bytes)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def __enter__(self):
+        self._monitor_con = self.db.cursor()
+        self._start_ns = time.perf_counter_ns()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        elapsed_s = (time.perf_counter_ns() - self._start_ns) / 1e9
+        if exc_type is None:
+            # Sample once more, the stage may have been shorter than `interval_s`
+            self._sample()
+            num_rows = (
+                self.db.execute(f"SELECT COUNT(*) FROM {self.table_name}").fetchone()[0]
+                if self.table_name is not None
+                else None
+            )
+            log(
+                f"{self.name}: {elapsed_s:.1f}s"
+                + (f", {num_rows} rows" if num_rows is not None else "")
+                + f", peak memory: {self.peak_rss_bytes / 2**20:.0f} MiB RSS"
+                + f" ({self.peak_duckdb_memory_bytes / 2**20:.0f} MiB in DuckDB"
+                + f", {self.peak_spilled_bytes / 2**20:.0f} MiB spilled)"
+            )
+        self._monitor_con.close()
+        return False
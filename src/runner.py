@@ -0,0 +1,1074 @@
+import os
+import re
+import time
+import threading
+import multiprocessing
+from collections import defaultdict
+from datetime import datetime
+import duckdb
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .utils import *
+from .redbench import WORKLOADS_DIR
+from .engines import DuckDBEngine, CachingEngine
+from .corpus import read_query_file
+from .packed_workload import PACKED_WORKLOAD_SUFFIX, PackedWorkload
+from .profiles import read_profile, parse_profile_operators
+from .resources import ResourceSampler
+
+
+# Columns of the per-query results tables, prefixed by mode-specific columns
+RESULT_COLUMNS = [
+    "bucket",
+    "workload_type",
+    "position",
+    "filepath",
+    "latency_ms",
+    "num_rows",
+    "status",
+    "error",
+]
+
+# Marks the start of a query in an unpacked workload (see `unpack_workloads` in setup.py)
+QUERY_HEADER_REGEX = re.compile(r"^-- (\S+\.sql)$", re.MULTILINE)
+
+# Fewest runs to bootstrap a CI from, e.g. a single run always has a CI of width 0
+MIN_CI_REPETITIONS = 3
+
+
+def get_workloads(workloads_dir=WORKLOADS_DIR, names=None):
+    """
+    Returns (bucket_name, workload_type, filepath) for every workload, sorted
+    by query repetition bucket and workload type. The filepath is the unpacked
+    .sql file if there is one, else the packed workload (see packed_workload.py)
+    if there is one, and the workload csv file otherwise.
+    If provided, `names` restricts the workloads to the given "<bucket>/<workload_type>".
+    """
+    workloads = []
+    for subdir in sorted(get_sub_directories(workloads_dir)):
+        bucket_name = os.path.basename(subdir)
+        filenames = os.listdir(subdir)
+        for filename in sorted(filenames):
+            if filename == "stats.csv" or not filename.endswith(".csv"):
+                continue
+            workload_type = filename[: -len(".csv")]
+            if names is not None and f"{bucket_name}/{workload_type}" not in names:
+                continue
+            if f"{workload_type}.sql" in filenames:
+                filename = f"{workload_type}.sql"
+            elif f"{workload_type}{PACKED_WORKLOAD_SUFFIX}" in filenames:
+                filename = f"{workload_type}{PACKED_WORKLOAD_SUFFIX}"
+            workloads.append((bucket_name, workload_type, os.path.join(subdir, filename)))
+    return workloads
+
+
+def read_workload(filepath):
+    """
+    Returns the (query_filepath, query) of a workload in workload order,
+    either from its unpacked .sql file, its packed workload, or,
+    for a csv file, from the query corpus.
+    """
+    if filepath.endswith(PACKED_WORKLOAD_SUFFIX):
+        return list(PackedWorkload(filepath))
+    if filepath.endswith(".csv"):
+        return read_csv_workload(filepath)
+    return read_sql_workload(filepath)
+
+
+def read_csv_workload(filepath):
+    """
+    Resolves the query filepaths of a workload csv file without unpacking it.
+    """
+    with open(filepath, "r") as csv_file:
+        # Skip the header
+        next(csv_file, None)
+        query_filepaths = [line.split(",")[0] for line in csv_file if line.strip()]
+    queries = dict()
+    for query_filepath in set(query_filepaths):
+        queries[query_filepath] = read_query_file(query_filepath).strip()
+    return [(query_filepath, queries[query_filepath]) for query_filepath in query_filepaths]
+
+
+def read_sql_workload(filepath):
+    """
+    Splits an unpacked workload into its queries.
+    Returns a list of (query_filepath, query) in workload order.
+    """
+    with open(filepath, "r") as file:
+        text = file.read()
+    # re.split alternates between the text before a header, the captured
+    # query filepath, and the query text up to the next header.
+    parts = QUERY_HEADER_REGEX.split(text)
+    return [
+        (parts[i], parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2)
+    ]
+
+
+def get_arrival_timestamps(workload_dir, workload_type, redset_db=None):
+    """
+    Returns the Redset arrival timestamp of every query in a workload, in workload order.
+
+    Workloads generated with arrival timestamps carry them in their csv file.
+    For older workloads, we look them up in the table 'redset' of `redset_db`
+    based on the sampled user (see stats.csv) and the Redset query_id.
+    """
+    with open(os.path.join(workload_dir, f"{workload_type}.csv"), "r") as csv_file:
+        header = csv_file.readline().strip().split(",")
+        rows = [line.strip().split(",") for line in csv_file if line.strip()]
+    if "arrival_timestamp" in header:
+        idx = header.index("arrival_timestamp")
+        return [datetime.fromisoformat(row[idx]) for row in rows]
+
+    assert (
+        redset_db is not None
+    ), f"{workload_dir}/{workload_type}.csv has no arrival timestamps and no Redset database was provided."
+    with open(os.path.join(workload_dir, "stats.csv"), "r") as stats_file:
+        stats_header = stats_file.readline().strip().split(",")
+        user = [
+            dict(zip(stats_header, line.strip().split(",")))
+            for line in stats_file
+            if line.startswith(f"{workload_type},")
+        ][0]
+    user_key = f"{user['user_id']}#{user['instance_id']}"
+    query_id_to_arrival_timestamp = dict(
+        redset_db.execute(
+            f"""
+            select query_id, arrival_timestamp
+            from redset
+            where user_key = '{user_key}'
+        """
+        ).fetchall()
+    )
+    idx = header.index("query_id")
+    return [query_id_to_arrival_timestamp[int(row[idx])] for row in rows]
+
+
+def get_expected_repetitions(workload_dir, workload_type):
+    """
+    Number of repeated queries in a workload according to its sampling stats:
+    every query that didn't go through a sampling step (see DETAILS.md) reuses
+    the benchmark query of an earlier user query.
+    """
+    with open(os.path.join(workload_dir, "stats.csv"), "r") as stats_file:
+        header = stats_file.readline().strip().split(",")
+        for line in stats_file:
+            user = dict(zip(header, line.strip().split(",")))
+            if user["workload_type"] != workload_type:
+                continue
+            return int(user["number_of_queries"]) - sum(
+                int(value)
+                for column, value in user.items()
+                if column.startswith("n_occurrences_step_")
+            )
+    return None
+
+
+def run_with_timeout(engine, con, fn, timeout_s=None):
+    """
+    Calls `fn()`, which runs a query on `con`, and interrupts the query after
+    `timeout_s` seconds. Engines that can't interrupt queries let it finish,
+    but it still counts as timed out.
+    Returns (result, elapsed ms, status, error message), where status is
+    "ok", "timeout", or "error". Failed queries don't stop the run.
+    """
+    timed_out = threading.Event()
+    finished = threading.Lock()
+    done = False
+
+    def interrupt():
+        # Holding the lock, such that the query can't finish and the next
+        # one start while we interrupt
+        with finished:
+            if done:
+                return
+            timed_out.set()
+            engine.interrupt(con)
+
+    timer = None
+    if timeout_s is not None and engine.supports_interrupt:
+        timer = threading.Timer(timeout_s, interrupt)
+        timer.start()
+    result, error = None, None
+    start_time = time.perf_counter_ns()
+    try:
+        result = fn()
+    except Exception as e:
+        error = str(e).strip() or type(e).__name__
+    finally:
+        with finished:
+            done = True
+        if timer is not None:
+            timer.cancel()
+            # The timer may already be running `interrupt`
+            timer.join()
+    elapsed_ms = (time.perf_counter_ns() - start_time) / 1e6
+    if timed_out.is_set() or (timeout_s is not None and elapsed_ms > timeout_s * 1e3):
+        return None, elapsed_ms, "timeout", error
+    return result, elapsed_ms, "ok" if error is None else "error", error
+
+
+def run_query(engine, con, query, timeout_s=None):
+    """
+    Runs a single query and returns its latency in ms (including fetching the
+    result), its number of result rows (None if it failed), its status, and
+    its error message (see `run_with_timeout`).
+    """
+    rows, latency_ms, status, error = run_with_timeout(
+        engine, con, lambda: engine.run(con, query), timeout_s
+    )
+    return latency_ms, None if rows is None else len(rows), status, error
+
+
+def run_prepared_query(engine, con, statements, query_filepath, query, timeout_s=None):
+    """
+    Runs a query through a prepared statement of `con`, which is prepared
+    on the first occurrence of the query file and reused afterwards.
+    `statements` maps the query files of the session to (statement name, planning_ms).
+    Returns the planning and execution time in ms, whether the plan was
+    reused, the number of result rows, the status, and the error message.
+    """
+    reused = query_filepath in statements
+    if not reused:
+        name = f"redbench_{len(statements)}"
+        _, planning_ms, status, error = run_with_timeout(
+            engine, con, lambda: engine.prepare(con, name, query), timeout_s
+        )
+        if status != "ok":
+            if status == "timeout" and not engine.interrupt_keeps_session:
+                statements.clear()
+            return planning_ms, 0.0, False, None, status, error
+        statements[query_filepath] = (name, planning_ms)
+    name, planning_ms = statements[query_filepath]
+    rows, execution_ms, status, error = run_with_timeout(
+        engine,
+        con,
+        lambda: engine.fetch(engine.execute_prepared(con, name)),
+        timeout_s,
+    )
+    if status == "timeout" and not engine.interrupt_keeps_session:
+        # The session and thus all of its prepared statements are gone
+        statements.clear()
+    return (
+        planning_ms,
+        execution_ms,
+        reused,
+        None if rows is None else len(rows),
+        status,
+        error,
+    )
+
+
+def run_workload_queries(
+    engine,
+    con,
+    filepath,
+    profile_filepath=None,
+    statements=None,
+    on_query_start=None,
+    timeout_s=None,
+):
+    """
+    Runs the queries of an unpacked workload one after the other on `con`.
+    Returns one record (position, filepath, latency_ms, num_rows, status, error)
+    per query, where every query is interrupted after `timeout_s` seconds.
+    If `con` writes query profiles to `profile_filepath`, the records also
+    contain the parsed profile. With a `statements` map, queries run as
+    prepared statements (see `run_prepared_query`) and the records also
+    contain the planning and execution times.
+    If provided, `on_query_start(position)` is called before every query.
+    """
+    results = []
+    for position, (query_filepath, query) in enumerate(read_workload(filepath)):
+        if on_query_start is not None:
+            on_query_start(position)
+        if statements is None:
+            latency_ms, num_rows, status, error = run_query(
+                engine, con, query, timeout_s
+            )
+            results.append(
+                {
+                    "position": position,
+                    "filepath": query_filepath,
+                    "latency_ms": latency_ms,
+                    "num_rows": num_rows,
+                    "status": status,
+                    "error": error,
+                }
+            )
+        else:
+            planning_ms, execution_ms, reused, num_rows, status, error = (
+                run_prepared_query(
+                    engine, con, statements, query_filepath, query, timeout_s
+                )
+            )
+            results.append(
+                {
+                    "position": position,
+                    "filepath": query_filepath,
+                    # Reused plans don't pay for planning again
+                    "latency_ms": execution_ms + (0 if reused else planning_ms),
+                    "num_rows": num_rows,
+                    "status": status,
+                    "error": error,
+                    "plan_reused": reused,
+                    "planning_ms": 0 if reused else planning_ms,
+                    "execution_ms": execution_ms,
+                    "saved_planning_ms": planning_ms if reused else 0,
+                }
+            )
+        if profile_filepath is not None and status == "ok":
+            results[-1]["profile"] = read_profile(profile_filepath)
+    return results
+
+
+def _run_stream(
+    engine, stream_id, bucket_name, workload_type, filepath, timeout_s=None
+):
+    # Every stream is a client on its own connection. This is a module-level
+    # function such that it can be shipped to a process pool.
+    con = engine.connect()
+    try:
+        results = run_workload_queries(engine, con, filepath, timeout_s=timeout_s)
+    finally:
+        engine.close(con)
+    for result in results:
+        result.update(
+            stream_id=stream_id, bucket=bucket_name, workload_type=workload_type
+        )
+    return results
+
+
+def _run_trial(engine, workloads, con=None, timeout_s=None):
+    # Runs every workload once. Without a connection, this opens a fresh
+    # session, e.g. in a newly started process for cold runs.
+    own_con = con is None
+    if own_con:
+        con = engine.connect()
+    try:
+        results = []
+        for bucket_name, workload_type, filepath in workloads:
+            if isinstance(engine, CachingEngine):
+                # Every workload is a separate user session with a cold cache
+                engine.cache.clear()
+            for result in run_workload_queries(
+                engine, con, filepath, timeout_s=timeout_s
+            ):
+                result.update(bucket=bucket_name, workload_type=workload_type)
+                results.append(result)
+        return results
+    finally:
+        if own_con:
+            engine.close(con)
+
+
+def evict_page_cache(filepath):
+    """
+    Asks the OS to drop the cached pages of `filepath`.
+    Returns False if this isn't supported or permitted on this system.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        return True
+    except OSError:
+        return False
+
+
+def bootstrap_ci(values, confidence=0.95, num_resamples=1000, seed=0):
+    """
+    Bootstrap confidence interval of the median of `values`.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.asarray(values)
+    medians = np.median(
+        rng.choice(values, size=(num_resamples, len(values)), replace=True), axis=1
+    )
+    alpha = (1 - confidence) / 2
+    return float(np.quantile(medians, alpha)), float(np.quantile(medians, 1 - alpha))
+
+
+def _percentiles(values):
+    return (
+        float(np.percentile(values, 50)),
+        float(np.percentile(values, 95)),
+        float(np.percentile(values, 99)),
+    )
+
+
+class Runner:
+    """
+    Runs the unpacked Redbench workloads query by query through an engine
+    adapter and records the latency of every query.
+
+    Args:
+        engine (Engine): The adapter of the system to run the workloads on (default: in-process DuckDB).
+        results_db (duckdb.DuckDBPyConnection): Where the per-query results are stored.
+        timeout_s (float): Queries running longer are interrupted and recorded as timed out (default: no timeout).
+    """
+
+    def __init__(self, engine=None, results_db=None, timeout_s=None):
+        self.engine = engine or DuckDBEngine()
+        self.results_db = results_db
+        self.timeout_s = timeout_s
+        self.results = []
+        self.stream_results = []
+        self.open_loop_results = []
+        self.trial_results = []
+        self.cache_stats = []
+        self.operator_profiles = []
+        self.resource_samples = []
+
+    def _run_workload(
+        self,
+        con,
+        bucket_name,
+        workload_type,
+        filepath,
+        profile_filepath=None,
+        statements=None,
+        sampler=None,
+    ):
+        on_query_start = (
+            (lambda position: sampler.mark(bucket_name, workload_type, position))
+            if sampler is not None
+            else None
+        )
+        for result in run_workload_queries(
+            self.engine,
+            con,
+            filepath,
+            profile_filepath,
+            statements,
+            on_query_start,
+            self.timeout_s,
+        ):
+            result.update(bucket=bucket_name, workload_type=workload_type)
+            if "profile" in result:
+                for operator in parse_profile_operators(result.pop("profile")):
+                    operator.update(
+                        {column: result[column] for column in RESULT_COLUMNS[:4]}
+                    )
+                    self.operator_profiles.append(operator)
+            self.results.append(result)
+
+    def run(
+        self,
+        workloads_dir=WORKLOADS_DIR,
+        names=None,
+        profile=False,
+        prepare=False,
+        sample_interval_s=None,
+    ):
+        """
+        Runs the workloads one after the other on a single connection.
+        With `profile`, the operator profile of every query is captured as well.
+        With `prepare`, every query file is prepared once per workload, i.e. per
+        user session, and its plan is reused on repeats.
+        With `sample_interval_s`, the resource usage of the engine is sampled
+        in the background at this interval and at every query start.
+        """
+        self.results = []
+        self.cache_stats = []
+        self.operator_profiles = []
+        cache = self.engine.cache if isinstance(self.engine, CachingEngine) else None
+        if prepare and not self.engine.supports_prepare:
+            raise ValueError(f"{self.engine.name} does not support prepared statements.")
+        if profile and not self.engine.supports_profiling:
+            raise ValueError(f"{self.engine.name} does not support profiling.")
+        # Open the database once for the whole run
+        con = self.engine.connect()
+        profile_filepath = None
+        if profile:
+            os.makedirs("tmp", exist_ok=True)
+            profile_filepath = f"tmp/query_profile_{os.getpid()}.json"
+            self.engine.enable_profiling(con, profile_filepath)
+        sampler = None
+        if sample_interval_s is not None:
+            sampler = ResourceSampler(self.engine, con, sample_interval_s)
+            sampler.start()
+        try:
+            for bucket_name, workload_type, filepath in get_workloads(
+                workloads_dir, names
+            ):
+                log(f"Running Redbench workload {bucket_name}/{workload_type}..")
+                if cache is not None:
+                    # Every workload is a separate user session with a cold cache
+                    cache.clear()
+                    cache.reset_stats()
+                # ... and without prepared statements (re-preparing a name replaces it)
+                statements = dict() if prepare else None
+                self._run_workload(
+                    con,
+                    bucket_name,
+                    workload_type,
+                    filepath,
+                    profile_filepath,
+                    statements,
+                    sampler,
+                )
+                if cache is not None:
+                    self.cache_stats.append(
+                        {
+                            "bucket": bucket_name,
+                            "workload_type": workload_type,
+                            "hits": cache.hits,
+                            "misses": cache.misses,
+                            "evictions": cache.evictions,
+                            "peak_bytes": cache.peak_bytes,
+                            "time_saved_ms": cache.time_saved_ms,
+                            "expected_repetitions": get_expected_repetitions(
+                                os.path.dirname(filepath), workload_type
+                            ),
+                        }
+                    )
+        finally:
+            if sampler is not None:
+                sampler.stop()
+                self.resource_samples = sampler.samples
+            self.engine.close(con)
+            if profile_filepath is not None and os.path.exists(profile_filepath):
+                os.remove(profile_filepath)
+        self._save_table(
+            "query_results",
+            self.results,
+            RESULT_COLUMNS
+            + (
+                ["plan_reused", "planning_ms", "execution_ms", "saved_planning_ms"]
+                if prepare
+                else []
+            ),
+        )
+        if sampler is not None:
+            self._save_table(
+                "resource_samples",
+                self.resource_samples,
+                RESULT_COLUMNS[:3]
+                + [
+                    "timestamp_ms",
+                    "cpu_time_ms",
+                    "rss_bytes",
+                    "peak_rss_bytes",
+                    "engine_memory_bytes",
+                    "read_bytes",
+                    "write_bytes",
+                    "read_syscall_bytes",
+                    "write_syscall_bytes",
+                ],
+            )
+        if profile:
+            self._save_table(
+                "operator_profiles",
+                self.operator_profiles,
+                RESULT_COLUMNS[:4]
+                + [
+                    "operator_id",
+                    "depth",
+                    "operator_type",
+                    "operator_category",
+                    "operator_timing_ms",
+                    "operator_cardinality",
+                    "operator_rows_scanned",
+                ],
+            )
+        if cache is not None:
+            self._save_table(
+                "cache_stats",
+                self.cache_stats,
+                [
+                    "bucket",
+                    "workload_type",
+                    "hits",
+                    "misses",
+                    "evictions",
+                    "peak_bytes",
+                    "time_saved_ms",
+                    "expected_repetitions",
+                ],
+            )
+
+    def get_resource_summary(self):
+        """
+        Returns per-bucket (bucket, peak_rss_bytes, mean_rss_bytes,
+        peak_engine_memory_bytes, mean_engine_memory_bytes, cpu_time_ms,
+        cpu_utilization, read_bytes, write_bytes) from the resource samples.
+        Cumulative counters are attributed to the bucket of the query during
+        which they increased.
+        """
+        return self.results_db.execute(
+            """
+            WITH deltas AS (
+                SELECT
+                    *,
+                    lead(cpu_time_ms) OVER w - cpu_time_ms AS cpu_time_delta_ms,
+                    lead(timestamp_ms) OVER w - timestamp_ms AS wall_time_delta_ms,
+                    lead(read_bytes) OVER w - read_bytes AS read_bytes_delta,
+                    lead(write_bytes) OVER w - write_bytes AS write_bytes_delta
+                FROM resource_samples
+                WINDOW w AS (ORDER BY timestamp_ms)
+            )
+            SELECT
+                bucket,
+                max(peak_rss_bytes),
+                avg(rss_bytes),
+                max(engine_memory_bytes),
+                avg(engine_memory_bytes),
+                sum(cpu_time_delta_ms),
+                sum(cpu_time_delta_ms) / sum(wall_time_delta_ms),
+                sum(read_bytes_delta),
+                sum(write_bytes_delta)
+            FROM deltas
+            WHERE bucket IS NOT NULL
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        ).fetchall()
+
+    def get_planning_summary(self):
+        """
+        Returns per-bucket (bucket, num_queries, num_plan_reuses, planning_ms,
+        execution_ms, saved_planning_ms) of a run with prepared statements.
+        """
+        return self.results_db.execute(
+            """
+            SELECT
+                bucket,
+                count(*) AS num_queries,
+                count(*) FILTER (WHERE plan_reused) AS num_plan_reuses,
+                sum(planning_ms) AS planning_ms,
+                sum(execution_ms) AS execution_ms,
+                sum(saved_planning_ms) AS saved_planning_ms
+            FROM query_results
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        ).fetchall()
+
+    def get_operator_summary(self):
+        """
+        Returns per bucket and operator category (bucket, operator_category,
+        num_operators, total_ms, share of the bucket's operator time, total_cardinality).
+        """
+        return self.results_db.execute(
+            """
+            SELECT
+                bucket,
+                operator_category,
+                count(*) AS num_operators,
+                sum(operator_timing_ms) AS total_ms,
+                sum(operator_timing_ms)
+                    / sum(sum(operator_timing_ms)) OVER (PARTITION BY bucket) AS time_share,
+                sum(operator_cardinality) AS total_cardinality
+            FROM operator_profiles
+            GROUP BY bucket, operator_category
+            ORDER BY bucket, total_ms DESC
+        """
+        ).fetchall()
+
+    def get_cache_summary(self):
+        """
+        Returns per-bucket (bucket, hit_rate, expected repetition rate, peak_bytes, time_saved_ms).
+        The expected repetition rate follows from the workload sampling stats in stats.csv.
+        """
+        return self.results_db.execute(
+            """
+            SELECT
+                bucket,
+                sum(hits) / sum(hits + misses) AS hit_rate,
+                sum(expected_repetitions) / sum(hits + misses) AS expected_hit_rate,
+                max(peak_bytes) AS peak_bytes,
+                sum(time_saved_ms) AS time_saved_ms
+            FROM cache_stats
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        ).fetchall()
+
+    def run_trials(
+        self,
+        workloads,
+        repetitions=5,
+        warmup=0,
+        mode="warm",
+        target_ci_width=None,
+        max_repetitions=30,
+    ):
+        """
+        Runs all workloads `repetitions` times after `warmup` discarded runs.
+
+        In "warm" mode, all runs share one session. In "cold" mode, every run
+        starts in a fresh process after evicting the database file from the OS
+        page cache (where permitted).
+        With `target_ci_width`, we keep repeating (up to `max_repetitions`) until
+        the bootstrap CI of every median is at most that wide, relative to the median.
+        The CI is only checked after at least MIN_CI_REPETITIONS runs, as a single
+        run has a CI of width 0.
+        Returns the per-bucket and per-workload statistics over the runs.
+        """
+        assert mode in ["warm", "cold"], f"Unknown mode {mode}."
+        self.trial_results = []
+        min_repetitions = repetitions
+        if target_ci_width is not None:
+            min_repetitions = max(repetitions, MIN_CI_REPETITIONS)
+        con = self.engine.connect() if mode == "warm" else None
+        try:
+            for trial in range(-warmup, max(min_repetitions, max_repetitions)):
+                if trial >= min_repetitions and (
+                    target_ci_width is None
+                    or self._max_relative_ci_width() <= target_ci_width
+                ):
+                    break
+                label = "warmup run" if trial < 0 else f"run {trial + 1}"
+                log(f"Running Redbench {label} ({mode})..")
+                if con is not None:
+                    results = _run_trial(
+                        self.engine, workloads, con, self.timeout_s
+                    )
+                else:
+                    db_filepath = self.engine.db_filepath
+                    if db_filepath is None or not evict_page_cache(db_filepath):
+                        log(f"Couldn't evict {db_filepath} from the OS page cache.")
+                    # A fresh process does not share any caches with the previous runs
+                    with ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                    ) as executor:
+                        results = executor.submit(
+                            _run_trial, self.engine, workloads, None, self.timeout_s
+                        ).result()
+                if trial < 0:
+                    continue
+                for result in results:
+                    result.update(trial=trial, mode=mode)
+                    self.trial_results.append(result)
+        finally:
+            if con is not None:
+                self.engine.close(con)
+        self._save_table(
+            "trial_results", self.trial_results, ["mode", "trial"] + RESULT_COLUMNS
+        )
+        return self.get_trial_stats()
+
+    def _get_trial_totals(self):
+        # Total execution time in ms of every bucket and workload per run
+        totals = defaultdict(lambda: defaultdict(float))
+        for result in self.trial_results:
+            totals[("bucket", result["bucket"])][result["trial"]] += result[
+                "latency_ms"
+            ]
+            totals[
+                ("workload", f"{result['bucket']}/{result['workload_type']}")
+            ][result["trial"]] += result["latency_ms"]
+        return {key: list(values.values()) for key, values in totals.items()}
+
+    def _max_relative_ci_width(self):
+        widths = []
+        for values in self._get_trial_totals().values():
+            median = np.median(values)
+            # E.g. all queries answered from the cache -> nothing to be relative to
+            if median == 0:
+                continue
+            ci_lo, ci_hi = bootstrap_ci(values)
+            widths.append((ci_hi - ci_lo) / median)
+        return max(widths, default=0.0)
+
+    def get_trial_stats(self):
+        """
+        Returns (level, name, num_runs, median_ms, iqr_ms, ci_lo_ms, ci_hi_ms)
+        per bucket and per workload, where level is either "bucket" or "workload".
+        """
+        stats = []
+        for (level, name), values in sorted(self._get_trial_totals().items()):
+            q25, median, q75 = np.percentile(values, [25, 50, 75])
+            ci_lo, ci_hi = bootstrap_ci(values)
+            stats.append(
+                (level, name, len(values), float(median), float(q75 - q25), ci_lo, ci_hi)
+            )
+        return stats
+
+    def run_concurrent(self, workloads, copies=1, pool_size=None, use_processes=False):
+        """
+        Replays the given workloads (each `copies` times) as concurrent client
+        streams against the same database.
+
+        Every distinct workload is first run alone to get its isolated latencies,
+        such that we can quantify how much the concurrent streams slow each other down.
+        Returns the aggregate stats of the concurrent phase and one stats dict per stream.
+        """
+        streams = [
+            (stream_id, *workload)
+            for stream_id, workload in enumerate(
+                [workload for workload in workloads for _ in range(copies)]
+            )
+        ]
+        pool_size = pool_size or len(streams)
+        assert (
+            self.engine.supports_concurrency or pool_size == 1
+        ), f"{self.engine.name} does not support concurrent connections."
+
+        log(f"Running {len(workloads)} workload(s) in isolation..")
+        isolated_results = dict()
+        for bucket_name, workload_type, filepath in workloads:
+            isolated_results[filepath] = _run_stream(
+                self.engine, None, bucket_name, workload_type, filepath, self.timeout_s
+            )
+
+        log(
+            f"Replaying {len(streams)} stream(s) on a {'process' if use_processes else 'thread'} pool of size {pool_size}.."
+        )
+        if use_processes:
+            # Don't fork the multi-threaded DuckDB of this process
+            executor = ProcessPoolExecutor(
+                max_workers=pool_size, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=pool_size)
+        start_time = time.perf_counter_ns()
+        with executor:
+            futures = [
+                executor.submit(_run_stream, self.engine, *stream, self.timeout_s)
+                for stream in streams
+            ]
+            stream_results = [future.result() for future in futures]
+        wall_time_s = (time.perf_counter_ns() - start_time) / 1e9
+
+        # Store all latencies, the isolated ones with stream_id NULL
+        self.stream_results = [
+            dict(result, phase="isolated")
+            for results in isolated_results.values()
+            for result in results
+        ] + [
+            dict(result, phase="concurrent")
+            for results in stream_results
+            for result in results
+        ]
+        self._save_table(
+            "stream_results", self.stream_results, ["phase", "stream_id"] + RESULT_COLUMNS
+        )
+
+        stats = []
+        for (stream_id, bucket_name, workload_type, filepath), results in zip(
+            streams, stream_results
+        ):
+            latencies = [result["latency_ms"] for result in results]
+            isolated_latencies = [
+                result["latency_ms"] for result in isolated_results[filepath]
+            ]
+            p50, p95, p99 = _percentiles(latencies)
+            # E.g. all queries answered from a cache -> nothing to be relative to
+            slowdown = float("nan")
+            if sum(isolated_latencies) > 0:
+                slowdown = sum(latencies) / sum(isolated_latencies)
+            stats.append(
+                {
+                    "stream_id": stream_id,
+                    "workload": f"{bucket_name}/{workload_type}",
+                    "num_queries": len(latencies),
+                    "total_ms": sum(latencies),
+                    "isolated_total_ms": sum(isolated_latencies),
+                    "p50_ms": p50,
+                    "p95_ms": p95,
+                    "p99_ms": p99,
+                    # Slowdown of the stream w.r.t. running it alone
+                    "slowdown": slowdown,
+                }
+            )
+
+        num_queries = sum(stream["num_queries"] for stream in stats)
+        all_latencies = [
+            result["latency_ms"] for results in stream_results for result in results
+        ]
+        p50, p95, p99 = _percentiles(all_latencies)
+        isolated_total_ms = sum(stream["isolated_total_ms"] for stream in stats)
+        slowdowns = [
+            stream["slowdown"] for stream in stats if not np.isnan(stream["slowdown"])
+        ]
+        aggregate = {
+            "num_streams": len(streams),
+            "num_queries": num_queries,
+            "wall_time_s": wall_time_s,
+            "qps": num_queries / wall_time_s,
+            # Throughput when the same queries run back to back on a single client
+            "isolated_qps": num_queries / (isolated_total_ms / 1e3)
+            if isolated_total_ms > 0
+            else float("nan"),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "mean_slowdown": sum(slowdowns) / len(slowdowns)
+            if slowdowns
+            else float("nan"),
+        }
+        return aggregate, stats
+
+    def run_open_loop(
+        self, workloads, time_compression=1000, pool_size=None, redset_db=None
+    ):
+        """
+        Replays every workload open-loop: each query is submitted at its Redset
+        arrival time (relative to the workload's first query, divided by
+        `time_compression`), independently of whether earlier queries finished.
+        Queries wait for one of the `pool_size` clients, so we record their
+        queueing delay separately from their execution time.
+        """
+        pool_size = pool_size or os.cpu_count()
+        assert (
+            self.engine.supports_concurrency or pool_size == 1
+        ), f"{self.engine.name} does not support concurrent connections."
+        self.open_loop_results = []
+        # One connection per client, reused across workloads
+        pool = self.engine.pool(pool_size)
+        try:
+            for bucket_name, workload_type, filepath in workloads:
+                log(
+                    f"Replaying Redbench workload {bucket_name}/{workload_type} open-loop (time compression: {time_compression}x)..",
+                )
+                arrival_timestamps = get_arrival_timestamps(
+                    os.path.dirname(filepath), workload_type, redset_db
+                )
+                for result in self._replay_open_loop(
+                    pool,
+                    read_workload(filepath),
+                    arrival_timestamps,
+                    time_compression,
+                    pool_size,
+                ):
+                    result.update(bucket=bucket_name, workload_type=workload_type)
+                    self.open_loop_results.append(result)
+        finally:
+            pool.close()
+        self._save_table(
+            "open_loop_results",
+            self.open_loop_results,
+            RESULT_COLUMNS + ["scheduled_ms", "queue_delay_ms"],
+        )
+
+    def _replay_open_loop(
+        self, pool, queries, arrival_timestamps, time_compression, pool_size
+    ):
+        assert len(queries) == len(arrival_timestamps)
+        first_arrival = min(arrival_timestamps)
+
+        def execute(position, query_filepath, query, scheduled_ns):
+            # Every client thread works on its own connection of the pool
+            with pool.connection() as con:
+                start_ns = time.perf_counter_ns()
+                latency_ms, num_rows, status, error = run_query(
+                    self.engine, con, query, self.timeout_s
+                )
+            return {
+                "position": position,
+                "filepath": query_filepath,
+                "scheduled_ms": (scheduled_ns - replay_start_ns) / 1e6,
+                "queue_delay_ms": (start_ns - scheduled_ns) / 1e6,
+                "latency_ms": latency_ms,
+                "num_rows": num_rows,
+                "status": status,
+                "error": error,
+            }
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            replay_start_ns = time.perf_counter_ns()
+            for position, ((query_filepath, query), arrival_timestamp) in enumerate(
+                zip(queries, arrival_timestamps)
+            ):
+                offset_s = (
+                    arrival_timestamp - first_arrival
+                ).total_seconds() / time_compression
+                scheduled_ns = replay_start_ns + int(offset_s * 1e9)
+                # Wait for the query's arrival, but never for earlier queries to finish
+                wait_s = (scheduled_ns - time.perf_counter_ns()) / 1e9
+                if wait_s > 0:
+                    time.sleep(wait_s)
+                futures.append(
+                    executor.submit(
+                        execute, position, query_filepath, query, scheduled_ns
+                    )
+                )
+            results = [future.result() for future in futures]
+        return results
+
+    def get_open_loop_summary(self):
+        """
+        Returns per-workload (bucket, workload_type, num_queries, replay_ms,
+        queueing delay p50/p95/p99, execution time p50/p95/p99).
+        """
+        return self.results_db.execute(
+            """
+            SELECT
+                bucket,
+                workload_type,
+                count(*) AS num_queries,
+                max(scheduled_ms + queue_delay_ms + latency_ms) AS replay_ms,
+                quantile_cont(queue_delay_ms, 0.5),
+                quantile_cont(queue_delay_ms, 0.95),
+                quantile_cont(queue_delay_ms, 0.99),
+                quantile_cont(latency_ms, 0.5),
+                quantile_cont(latency_ms, 0.95),
+                quantile_cont(latency_ms, 0.99)
+            FROM open_loop_results
+            GROUP BY bucket, workload_type
+            ORDER BY bucket, workload_type
+        """
+        ).fetchall()
+
+    def get_failure_summary(self, table_name="query_results"):
+        """
+        Returns per-bucket (bucket, num_queries, num_timeouts, num_errors) of
+        the buckets with timed out or failed queries in the given results table.
+        """
+        return self.results_db.execute(
+            f"""
+            SELECT
+                bucket,
+                count(*) AS num_queries,
+                count(*) FILTER (WHERE status = 'timeout') AS num_timeouts,
+                count(*) FILTER (WHERE status = 'error') AS num_errors
+            FROM {table_name}
+            GROUP BY bucket
+            HAVING num_timeouts + num_errors > 0
+            ORDER BY bucket
+        """
+        ).fetchall()
+
+    def _save_table(self, table_name, records, columns):
+        if self.results_db is None:
+            self.results_db = duckdb.connect()
+        results_df = pd.DataFrame(records, columns=columns)
+        self.results_db.execute(
+            f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM results_df"
+        )
+
+    def export_results(self, parquet_filepath):
+        self.results_db.execute(
+            f"COPY query_results TO '{parquet_filepath}' (FORMAT PARQUET)"
+        )
+        log(f"Per-query results exported to {parquet_filepath}.")
+
+    def get_summary(self):
+        """
+        Returns per-bucket (bucket, num_queries, num_timeouts, num_errors,
+        total_ms, p50_ms, p95_ms, p99_ms). Timed out and failed queries count
+        with the time until they were interrupted or failed.
+        """
+        return self.results_db.execute(
+            """
+            SELECT
+                bucket,
+                count(*) AS num_queries,
+                count(*) FILTER (WHERE status = 'timeout') AS num_timeouts,
+                count(*) FILTER (WHERE status = 'error') AS num_errors,
+                sum(latency_ms) AS total_ms,
+                quantile_cont(latency_ms, 0.5) AS p50_ms,
+                quantile_cont(latency_ms, 0.95) AS p95_ms,
+                quantile_cont(latency_ms, 0.99) AS p99_ms
+            FROM query_results
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        ).fetchall()
@@ -0,0 +1,233 @@
+import os
+import duckdb
+import numpy as np
+import pyarrow as pa
+from .utils import log
+
+
+SYNTHETIC_REDSET_DIR_PATH = "redset/synthetic/"
+NON_SELECT_QUERY_TYPES = ["insert", "update", "delete", "copy", "ctas"]
+
+
+def _uniform(seed, *keys):
+    # SQL expression of a uniform random number in [0, 1), keyed by the given SQL values
+    return f"((hash({seed}, {', '.join(keys)}) % 1000000007) / 1000000007)"
+
+
+class SyntheticRedset:
+    """
+    Generates a synthetic dataset with Redset's (provisioned) schema, e.g. to
+    run the generation pipeline offline or to load-test it at any scale.
+
+    Users are drawn up front, the queries of every user are then expanded and
+    written by DuckDB as a stream of Parquet files, such that the number of
+    queries is only bounded by the disk space. Every query is a function of
+    the seed, its user, and its position, i.e., the dataset is reproducible.
+
+    A user issues `num_templates` = (1 - repetition rate) * num_queries
+    distinct queries, and repeats random ones of them for the remaining
+    queries. A query's template fixes its num_joins, its readset (a random
+    run of num_joins + 1 consecutive tables of the user's table pool), its
+    fingerprint, and its query type, i.e., everything its query_hash is
+    built from.
+
+    Args:
+        num_users (int): Number of users.
+        num_instances (int): Number of clusters the users are spread across.
+        queries_per_user (int): Mean number of queries per user.
+        queries_per_user_sigma (float): Log-normal spread of the number of queries per user.
+        repetition_alpha (float), repetition_beta (float): Beta distribution of the users' repetition rates.
+        min_num_joins (int), max_num_joins (int): Range of the number of joins.
+        num_tables_per_user (int): Size of each user's table pool, i.e., the distinct tables they read.
+        start (str): First day of the dataset.
+        num_days (int): Number of days spanned by the dataset.
+        burstiness (float): Fraction of each user's queries in their busiest week.
+        select_ratio (float): Fraction of templates that are select queries.
+        cached_ratio (float): Fraction of queries answered from the result cache.
+        seed (int): Seed of the dataset.
+    """
+
+    def __init__(
+        self,
+        num_users=1000,
+        num_instances=100,
+        queries_per_user=1000,
+        queries_per_user_sigma=1.0,
+        repetition_alpha=0.5,
+        repetition_beta=0.5,
+        min_num_joins=1,
+        max_num_joins=12,
+        num_tables_per_user=50,
+        start="2024-03-01",
+        num_days=90,
+        burstiness=0.5,
+        select_ratio=0.8,
+        cached_ratio=0.1,
+        seed=0,
+    ):
+        assert min_num_joins <= max_num_joins
+        assert (
+            num_tables_per_user > max_num_joins
+        ), "A readset of num_joins + 1 tables must fit into a user's table pool"
+        assert num_days >= 7, "The dataset must span at least a week"
+        self.num_users = num_users
+        self.num_instances = num_instances
+        self.queries_per_user = queries_per_user
+        self.queries_per_user_sigma = queries_per_user_sigma
+        self.repetition_alpha = repetition_alpha
+        self.repetition_beta = repetition_beta
+        self.min_num_joins = min_num_joins
+        self.max_num_joins = max_num_joins
+        self.num_tables_per_user = num_tables_per_user
+        self.start = start
+        self.num_days = num_days
+        self.burstiness = burstiness
+        self.select_ratio = select_ratio
+        self.cached_ratio = cached_ratio
+        self.seed = seed
+
+    def _get_users(self):
+        """
+        Draws the per-user parameters.
+        """
+        rng = np.random.default_rng(self.seed)
+        user_idx = np.arange(self.num_users, dtype=np.int64)
+        # Log-normal with mean `queries_per_user`
+        num_queries = np.maximum(
+            1,
+            np.round(
+                rng.lognormal(
+                    np.log(self.queries_per_user) - self.queries_per_user_sigma**2 / 2,
+                    self.queries_per_user_sigma,
+                    self.num_users,
+                )
+            ),
+        ).astype(np.int64)
+        repetition_rate = rng.beta(
+            self.repetition_alpha, self.repetition_beta, self.num_users
+        )
+        num_templates = np.maximum(
+            1, np.round(num_queries * (1 - repetition_rate))
+        ).astype(np.int64)
+        # Every user joins within their own sub-range of [min_num_joins, max_num_joins]
+        num_joins_bounds = np.sort(
+            rng.integers(
+                self.min_num_joins, self.max_num_joins + 1, (self.num_users, 2)
+            ),
+            axis=1,
+        )
+        busiest_day = rng.integers(0, self.num_days - 7 + 1, self.num_users)
+        return pa.table(
+            {
+                "user_idx": user_idx,
+                "user_id": user_idx // self.num_instances,
+                "instance_id": user_idx % self.num_instances,
+                "num_queries": num_queries,
+                "num_templates": num_templates,
+                "min_num_joins": num_joins_bounds[:, 0],
+                "max_num_joins": num_joins_bounds[:, 1],
+                "busiest_day": busiest_day,
+                # The first query_id of the user
+                "query_id_offset": np.cumsum(num_queries) - num_queries,
+            }
+        )
+
+    def write(self, dir_path=SYNTHETIC_REDSET_DIR_PATH, file_size="512MB"):
+        """
+        Writes the dataset as Parquet files of about `file_size` into `dir_path`,
+        replacing any existing dataset there.
+        Returns the number of queries written.
+        """
+        users = self._get_users()
+        num_queries = int(users.column("num_queries").to_numpy().sum())
+        log(
+            f"Writing a synthetic Redset of {self.num_users} users and {num_queries} queries to {dir_path}.."
+        )
+        # Replace a previous dataset, but never anything else
+        if os.path.exists(dir_path):
+            filenames = os.listdir(dir_path)
+            assert all(
+                filename.endswith(".parquet") for filename in filenames
+            ), f"{dir_path} contains files other than a synthetic Redset"
+            for filename in filenames:
+                os.remove(os.path.join(dir_path, filename))
+            os.rmdir(dir_path)
+        os.makedirs(os.path.dirname(os.path.normpath(dir_path)) or ".", exist_ok=True)
+
+        db = duckdb.connect()
+        db.register("users", users)
+        uniform = lambda *keys: _uniform(self.seed, *keys)
+        db.execute(
+            f"""
+            COPY (
+                with queries as (
+                    select users.*, unnest(range(num_queries)) as position
+                    from users
+                ), templates as (
+                    select
+                        *,
+                        -- The first queries introduce the templates, the others repeat them
+                        case
+                            when position < num_templates then position
+                            else hash({self.seed}, user_idx, position, 'template') % num_templates
+                        end as template
+                    from queries
+                ), template_stats as (
+                    select
+                        *,
+                        min_num_joins + floor({uniform("user_idx", "template", "'num_joins'")} * (max_num_joins - min_num_joins + 1))::BIGINT as num_joins,
+                        floor({uniform("user_idx", "template", "'readset'")} * {self.num_tables_per_user})::BIGINT as first_table_id,
+                        {uniform("user_idx", "template", "'query_type'")} as query_type_key,
+                        -- Log-uniform between 1ms and ~1 minute
+                        exp({uniform("user_idx", "template", "'duration'")} * 11) as mean_duration_ms
+                    from templates
+                )
+                select
+                    instance_id,
+                    1::BIGINT as cluster_size,
+                    user_id,
+                    0::BIGINT as database_id,
+                    query_id_offset + position as query_id,
+                    (
+                        CASE
+                            WHEN {uniform("user_idx", "position", "'burst'")} < {self.burstiness}
+                            THEN '{self.start}'::timestamp + INTERVAL 1 DAY * busiest_day
+                                + to_microseconds(({uniform("user_idx", "position", "'arrival'")} * 7 * 86400e6)::BIGINT)
+                            ELSE '{self.start}'::timestamp
+                                + to_microseconds(({uniform("user_idx", "position", "'arrival'")} * {self.num_days} * 86400e6)::BIGINT)
+                        END
+                    ) as arrival_timestamp,
+                    0::BIGINT as compile_duration_ms,
+                    0::BIGINT as queue_duration_ms,
+                    (mean_duration_ms * (0.5 + {uniform("user_idx", "position", "'duration'")}))::BIGINT as execution_duration_ms,
+                    hash({self.seed}, user_idx, template, 'fingerprint')::VARCHAR as feature_fingerprint,
+                    false as was_aborted,
+                    {uniform("user_idx", "position", "'cached'")} < {self.cached_ratio} as was_cached,
+                    NULL::BIGINT as cache_source_query_id,
+                    CASE
+                        WHEN query_type_key < {self.select_ratio} THEN 'select'
+                        ELSE {NON_SELECT_QUERY_TYPES}[1 + floor(query_type_key * 1000)::BIGINT % {len(NON_SELECT_QUERY_TYPES)}]
+                    END as query_type,
+                    num_joins + 1 as num_permanent_tables_accessed,
+                    0::BIGINT as num_external_tables_accessed,
+                    0::BIGINT as num_system_tables_accessed,
+                    array_to_string(
+                        list_transform(
+                            range(num_joins + 1),
+                            table_offset -> (first_table_id + table_offset) % {self.num_tables_per_user}
+                        ),
+                        ','
+                    ) as read_table_ids,
+                    NULL::VARCHAR as write_table_ids,
+                    0::BIGINT as mbytes_scanned,
+                    0::BIGINT as mbytes_spilled,
+                    num_joins,
+                    num_joins + 1 as num_scans,
+                    0::BIGINT as num_aggregations
+                from template_stats
+            ) TO '{dir_path}' (FORMAT PARQUET, FILE_SIZE_BYTES '{file_size}')
+        """
+        )
+        db.close()
+        log(f"Finished writing the synthetic Redset to {dir_path}.")
+        return num_queries
@@ -1,17 +1,47 @@
-from collections import defaultdict
 import matplotlib.pyplot as plt
 import os
 from .utils import *
+from .resources import StageMonitor
+from .partitions import run_partitioned
 from matplotlib.ticker import PercentFormatter
 
 
+# Edges of the query repetition rate buckets, i.e., 0%-10%, .., 90%-100%
+REPETITION_BUCKET_EDGES = [i / 10 for i in range(11)]
+# The stats shown as box plots per bucket, and whether on a log scale
+BOX_PLOT_STATS = {
+    "mean_num_joins": False,
+    "total_num_queries": True,
+    "num_distinct_readsets": True,
+    "num_distinct_readset_sizes": False,
+    "num_distinct_num_joins": False,
+}
+
+
 class UserStats:
     """
     Aggregates statistics on users from the Redset dataset.
+
+    Args:
+        db (duckdb.DuckDB): The DuckDB database holding the table 'redset'.
+        num_partitions (int): If set, Redset is hash-partitioned by cluster, and
+            the stats of every partition are aggregated in a separate process.
+        num_workers (int): Number of worker processes (default: one per core).
+        bucket_edges (list): Edges of the query repetition rate buckets.
     """
 
-    def __init__(self, db):
+    def __init__(
+        self,
+        db,
+        num_partitions=None,
+        num_workers=None,
+        bucket_edges=REPETITION_BUCKET_EDGES,
+    ):
+        assert sorted(bucket_edges) == list(bucket_edges) and len(bucket_edges) >= 2
         self.db = db
+        self.num_partitions = num_partitions
+        self.num_workers = num_workers
+        self.bucket_edges = bucket_edges
 
     def _first_agg_step(self):
         """
@@ -62,31 +92,215 @@ class UserStats:
         Compute per-user aggregated readset stats: number of distinct readsets and readset sizes.
         """
 
-        # Find all distinct readsets for each user
-        redset_queries = (
-            self.db.execute(f"select * from redset").fetchdf().to_dict(orient="records")
+        # A readset is the sorted list of read table ids, so the same tables
+        # in a different order are the same readset
+        self.db.execute(
+            f"""
+            update user_stats
+                set
+                    num_distinct_readsets = readset_stats.num_distinct_readsets,
+                    num_distinct_readset_sizes = readset_stats.num_distinct_readset_sizes
+            from (
+                select
+                    user_key,
+                    count(*) as num_distinct_readsets,
+                    count(distinct len(readset)) as num_distinct_readset_sizes
+                from (
+                    select distinct
+                        user_key,
+                        list_sort(string_split(read_table_ids, ',')) as readset
+                    from redset
+                )
+                group by user_key
+            ) readset_stats
+            where user_stats.user_key = readset_stats.user_key
+        """
+        )
+
+    def _aggregate_partials(self, table_name, prefix=""):
+        """
+        Aggregates the queries of `table_name` into mergeable per-user partial
+        aggregates, from which 'user_stats' is derived when appending to Redset
+        (table names prefixed by `prefix`):
+        - 'user_partials': counts, sums, sums of squares, and min/max
+        - 'user_query_hashes': number of queries per distinct query hash
+        - 'user_num_joins': set of distinct num_joins
+        - 'user_readsets': set of distinct readsets, with their sizes
+        """
+
+        self.db.execute(
+            f"""
+            create or replace table {prefix}user_partials as
+                select
+                    user_key,
+                    count(*) as total_num_queries,
+                    sum(num_joins) as sum_num_joins,
+                    sum(num_joins::HUGEINT * num_joins) as sum_squared_num_joins,
+                    min(num_joins) as min_num_joins,
+                    max(num_joins) as max_num_joins,
+                    sum(execution_duration_ms) as total_exec_time
+                from {table_name}
+                group by user_key;
+
+            create or replace table {prefix}user_query_hashes as
+                select user_key, query_hash, count(*) as num_queries
+                from {table_name}
+                group by user_key, query_hash;
+
+            create or replace table {prefix}user_num_joins as
+                select distinct user_key, num_joins
+                from {table_name};
+
+            -- Same readsets as in `_second_agg_step`, as strings to be compared
+            create or replace table {prefix}user_readsets as
+                select distinct
+                    user_key,
+                    array_to_string(list_sort(string_split(read_table_ids, ',')), ',') as readset,
+                    len(string_split(read_table_ids, ',')) as readset_size
+                from {table_name};
+        """
+        )
+
+    def _fold_into_partials(self, batch_table):
+        """
+        Merges the queries of `batch_table` into the per-user partial aggregates.
+        """
+
+        self._aggregate_partials(batch_table, prefix="batch_")
+        self.db.execute(
+            f"""
+            update user_partials
+                set
+                    total_num_queries = user_partials.total_num_queries + batch.total_num_queries,
+                    sum_num_joins = user_partials.sum_num_joins + batch.sum_num_joins,
+                    sum_squared_num_joins = user_partials.sum_squared_num_joins + batch.sum_squared_num_joins,
+                    min_num_joins = least(user_partials.min_num_joins, batch.min_num_joins),
+                    max_num_joins = greatest(user_partials.max_num_joins, batch.max_num_joins),
+                    total_exec_time = user_partials.total_exec_time + batch.total_exec_time
+            from batch_user_partials batch
+            where user_partials.user_key = batch.user_key;
+
+            insert into user_partials
+                select * from batch_user_partials anti join user_partials using (user_key);
+
+            update user_query_hashes
+                set num_queries = user_query_hashes.num_queries + batch.num_queries
+            from batch_user_query_hashes batch
+            where user_query_hashes.user_key = batch.user_key
+                and user_query_hashes.query_hash = batch.query_hash;
+
+            insert into user_query_hashes
+                select * from batch_user_query_hashes anti join user_query_hashes using (user_key, query_hash);
+
+            insert into user_num_joins
+                select * from batch_user_num_joins anti join user_num_joins using (user_key, num_joins);
+
+            insert into user_readsets
+                select * from batch_user_readsets anti join user_readsets using (user_key, readset);
+
+            drop table batch_user_partials;
+            drop table batch_user_query_hashes;
+            drop table batch_user_num_joins;
+            drop table batch_user_readsets;
+        """
         )
-        user_to_readsets = defaultdict(set)
-        for query in redset_queries:
-            assert query["read_table_ids"] is not None
-            readset = tuple(sorted(query["read_table_ids"].split(",")))
-            user_to_readsets[query["user_key"]].add(readset)
-
-        # Update the users stats with the number of distinct readsets and readset sizes
-        for user_key, readsets in user_to_readsets.items():
-            num_readsets = len(readsets)
-            num_distinct_readset_sizes = len(
-                set({len(readset) for readset in readsets})
+
+    def _refresh_user_stats(self, batch_table):
+        """
+        Re-derives the rows of 'user_stats' of the users in `batch_table` from
+        their partial aggregates, i.e., without touching their past queries.
+        """
+
+        self.db.execute(
+            f"""
+            delete from user_stats
+            where user_key in (select user_key from {batch_table});
+
+            insert into user_stats
+            with batch_users as (
+                select distinct user_key from {batch_table}
+            ),
+            distinct_num_joins as (
+                select user_key, count(*) as num_distinct_num_joins
+                from user_num_joins semi join batch_users using (user_key)
+                group by user_key
+            ),
+            distinct_query_hashes as (
+                select user_key, count(*) as num_distinct_query_hashes
+                from user_query_hashes semi join batch_users using (user_key)
+                group by user_key
+            ),
+            distinct_readsets as (
+                select
+                    user_key,
+                    count(*) as num_distinct_readsets,
+                    count(distinct readset_size) as num_distinct_readset_sizes
+                from user_readsets semi join batch_users using (user_key)
+                group by user_key
             )
-            self.db.sql(
+            select
+                user_key,
+                total_num_queries,
+                sum_num_joins / total_num_queries as mean_num_joins,
+                -- VAR_POP, exact on the integer sums
+                (sum_squared_num_joins * total_num_queries - sum_num_joins * sum_num_joins)
+                    / (total_num_queries::HUGEINT * total_num_queries) as variance_num_joins,
+                min_num_joins,
+                max_num_joins,
+                num_distinct_num_joins,
+                total_exec_time,
+                -- Every query but the first one of each hash is a repetition
+                (total_num_queries - num_distinct_query_hashes) / total_num_queries as query_repetition_rate,
+                num_distinct_readsets,
+                num_distinct_readset_sizes
+            from user_partials
+                semi join batch_users using (user_key)
+                join distinct_num_joins using (user_key)
+                join distinct_query_hashes using (user_key)
+                join distinct_readsets using (user_key)
+        """
+        )
+
+    def _is_partials_collected(self):
+        return (
+            self.db.execute(
                 f"""
-                update user_stats
-                    set
-                        num_distinct_readsets = {num_readsets},
-                        num_distinct_readset_sizes = {num_distinct_readset_sizes}
-                    where user_key = '{user_key}'
-            """
-            )
+            SELECT COUNT(*)
+            FROM sqlite_master
+            WHERE type='table' AND name='user_partials'
+        """
+            ).fetchone()[0]
+            == 1
+        )
+
+    def append(self, batch_table):
+        """
+        Appends the queries of `batch_table` to 'redset', and incrementally
+        maintains 'user_stats' and 'user_stats_by_bucket': the batch is folded
+        into the partial aggregates, and only the stats of its users are
+        re-derived from them. The partial aggregates are built from 'redset'
+        on the first append after (re)collecting the user stats.
+
+        Args:
+            batch_table (str): Table or view with the columns of 'redset', incl. user_key and query_hash.
+        """
+        assert self._is_user_stats_collected(), "User stats not collected, see setup()"
+        log(f"Appending {batch_table} to Redset..")
+        self.db.execute("BEGIN TRANSACTION")
+        try:
+            if not self._is_partials_collected():
+                with StageMonitor(self.db, "Aggregating partial user stats", "user_partials"):
+                    self._aggregate_partials("redset")
+            with StageMonitor(self.db, "Folding the batch into the user stats", "user_stats"):
+                self.db.execute(f"insert into redset by name select * from {batch_table}")
+                self._fold_into_partials(batch_table)
+                self._refresh_user_stats(batch_table)
+            self._bucket_user_stats()
+        except BaseException:
+            # Also on KeyboardInterrupt, such that an interrupted append leaves no open transaction
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
 
     def _is_user_stats_collected(self):
         return (
@@ -110,47 +324,137 @@ class UserStats:
     def setup(self, override):
         if not override and self._is_user_stats_collected():
             log("User stats already collected.")
-            return
-        log("Collecting user stats..")
-        self._first_agg_step()
-        self._second_agg_step()
+        else:
+            self._collect_user_stats()
+        # Cheap, so always in line with the current bucket edges
+        self._bucket_user_stats()
 
-    def _dump_plot_1(self, dir_path):
-        xs_txt = [(ratio+10) / 100 for ratio in range(0, 91, 10)]
-        ys = []
-        ys2 = []
-        ys3 = []
-        for rep_ratio in range(10, 101, 10):
-            n_users = self.db.execute(
-                f"""
-                select count(*)
-                from user_stats
-                where
-                    query_repetition_rate between {rep_ratio/100-0.1} and {rep_ratio/100}
+    def _collect_user_stats(self):
+        log("Collecting user stats..")
+        # Redset may have changed, the partial aggregates are rebuilt on the next append
+        self.db.execute(
             """
-            ).fetchone()[0]
+            drop table if exists user_partials;
+            drop table if exists user_query_hashes;
+            drop table if exists user_num_joins;
+            drop table if exists user_readsets;
+        """
+        )
+        if self.num_partitions is not None:
+            with StageMonitor(self.db, "Aggregating user and readset stats", "user_stats"):
+                run_partitioned(
+                    self.db,
+                    "redset",
+                    "user_stats",
+                    _aggregate_user_stats,
+                    self.num_partitions,
+                    self.num_workers,
+                )
+            return
+        with StageMonitor(self.db, "Aggregating user stats", "user_stats"):
+            self._first_agg_step()
+        with StageMonitor(self.db, "Aggregating readset stats", "user_stats"):
+            self._second_agg_step()
 
-            ys.append(n_users)
+    def _bucket_user_stats(self):
+        """
+        Groups the users into query repetition rate buckets in the table
+        'user_stats_by_bucket', one row per non-empty bucket with its users'
+        counts, sums, and quartiles, and its users ordered by variability,
+        i.e., their rank by number of distinct num_joins plus their rank by
+        number of distinct readsets within the bucket.
 
-            n_queries = self.db.execute(
-                f"""
-                select sum(total_num_queries)
-                from user_stats
-                where
-                    query_repetition_rate between {rep_ratio/100-0.1} and {rep_ratio/100}
-            """
-            ).fetchone()[0]
-            ys2.append(n_queries)
+        Buckets include their lower edge and exclude their upper edge, except
+        for the last bucket, such that every user is in exactly one bucket.
+        """
+        edges = f"({list(self.bucket_edges)}::DOUBLE[])"
+        bucket = "\n".join(
+            f"WHEN query_repetition_rate < {edge}::DOUBLE THEN {i}"
+            for i, edge in enumerate(self.bucket_edges[1:-1])
+        )
+        # Min, quartiles, and max of the box-plotted stats
+        quartiles = ",\n".join(
+            f"quantile_cont({stat}, [0, 0.25, 0.5, 0.75, 1]) as {stat}_quartiles"
+            for stat in BOX_PLOT_STATS
+        )
+        self.db.execute(
+            f"""
+            create or replace table user_stats_by_bucket as
+            (
+                with bucketed_user_stats as (
+                    select
+                        *,
+                        CASE
+                            {bucket}
+                            ELSE {len(self.bucket_edges) - 2}
+                        END as bucket
+                    from user_stats
+                    where query_repetition_rate between {self.bucket_edges[0]}::DOUBLE and {self.bucket_edges[-1]}::DOUBLE
+                ),
+                ranked_user_stats as (
+                    select
+                        *,
+                        rank() over (partition by bucket order by num_distinct_num_joins asc) as rank_1,
+                        rank() over (partition by bucket order by num_distinct_readsets asc) as rank_2,
+                        rank_1 + rank_2 as variability
+                    from bucketed_user_stats
+                )
+                select
+                    bucket,
+                    {edges}[bucket + 1] as min_query_repetition_rate,
+                    {edges}[bucket + 2] as max_query_repetition_rate,
+                    concat(
+                        round({edges}[bucket + 1] * 100)::INTEGER, '%-',
+                        round({edges}[bucket + 2] * 100)::INTEGER, '%'
+                    ) as group_id,
+                    count(*) as num_users,
+                    sum(total_num_queries) as total_num_queries,
+                    sum(total_exec_time) as total_exec_time,
+                    {quartiles},
+                    list(ranked_user_stats order by variability, user_key asc) as users
+                from ranked_user_stats
+                group by bucket
+                order by bucket
+            )
+        """
+        )
 
-            sum_exec_time = self.db.execute(
-                f"""
-                select sum(total_exec_time)
-                from user_stats
-                where
-                    query_repetition_rate between {rep_ratio/100-0.1} and {rep_ratio/100}
-            """
-            ).fetchone()[0]
-            ys3.append(sum_exec_time)
+    def get_buckets(self):
+        """
+        The rows of 'user_stats_by_bucket' as dicts, for all buckets, i.e.,
+        with zero users for empty buckets.
+        """
+        buckets = {
+            row["bucket"]: row
+            for row in self.db.execute("select * from user_stats_by_bucket")
+            .fetchdf()
+            .to_dict(orient="records")
+        }
+        return [
+            buckets.get(
+                bucket,
+                {
+                    "bucket": bucket,
+                    "min_query_repetition_rate": lo,
+                    "max_query_repetition_rate": hi,
+                    "num_users": 0,
+                    "total_num_queries": 0,
+                    "total_exec_time": 0,
+                    **{f"{stat}_quartiles": None for stat in BOX_PLOT_STATS},
+                    "users": [],
+                },
+            )
+            for bucket, (lo, hi) in enumerate(
+                zip(self.bucket_edges[:-1], self.bucket_edges[1:])
+            )
+        ]
+
+    def _dump_plot_1(self, dir_path):
+        buckets = self.get_buckets()
+        xs_txt = [bucket["max_query_repetition_rate"] for bucket in buckets]
+        ys = [bucket["num_users"] for bucket in buckets]
+        ys2 = [bucket["total_num_queries"] for bucket in buckets]
+        ys3 = [bucket["total_exec_time"] for bucket in buckets]
 
         ys = [y / sum(ys) for y in ys]
         ys2 = [y / sum(ys2) for y in ys2]
@@ -185,31 +489,11 @@ class UserStats:
         plt.close()
 
     def _dump_plot_2(self, dir_path):
-        stats = {
-            "mean_num_joins": False,
-            "total_num_queries": True,
-            "num_distinct_readsets": True,
-            "num_distinct_readset_sizes": False,
-            "num_distinct_num_joins": False,
-        }
-        for stat, log_scale_y in stats.items():
-            ys = []
-            for rep_ratio in range(10, 101, 10):
-                n_joins_for_bracket = list(
-                    self.db.execute(
-                        f"""
-                        select {stat}
-                        from user_stats
-                        where
-                            query_repetition_rate between {rep_ratio/100-0.1} and {rep_ratio/100}
-                        order by {stat}
-                    """
-                    ).fetchdf()[stat]
-                )
-                ys.append(n_joins_for_bracket)
-            draw_box_plot(
-                [f"{rep_ratio}%" for rep_ratio in range(10, 101, 10)],
-                ys,
+        buckets = self.get_buckets()
+        for stat, log_scale_y in BOX_PLOT_STATS.items():
+            draw_quartile_box_plot(
+                [f"{round(bucket['max_query_repetition_rate'] * 100)}%" for bucket in buckets],
+                [bucket[f"{stat}_quartiles"] for bucket in buckets],
                 "Query repetition group",
                 f"Distr. of {stat} over users",
                 save_path=os.path.join(dir_path, f"02_{stat}.png"),
@@ -223,3 +507,10 @@ class UserStats:
         self._dump_plot_1(dir_path)
         self._dump_plot_2(dir_path)
         log(f"Redset plots dumped to {dir_path}.")
+
+
+def _aggregate_user_stats(db):
+    # Runs on a partition of Redset, see `run_partitioned`
+    user_stats = UserStats(db)
+    user_stats._first_agg_step()
+    user_stats._second_agg_step()
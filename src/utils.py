@@ -10,6 +10,7 @@ DB_FILEPATH = "db.duckdb"
 JOB_DIR_PATH = "imdb/benchmarks/job/"
 CEB_DIR_PATH = "imdb/benchmarks/ceb/"
 IMDB_DB_FILEPATH = "imdb/db.duckdb"
+RESULTS_DB_FILEPATH = "results.duckdb"
 
 
 LOGGER = logging.getLogger()
@@ -88,8 +89,25 @@ def get_readset_from_user_query(user_query):
     return tuple(sorted(map(int, user_query["read_table_ids"].split(","))))
 
 
-def get_experiment_db():
-    return duckdb.connect(DB_FILEPATH)
+def get_experiment_db(memory_limit=None, threads=None, temp_directory=None):
+    """
+    Connects to the experiment database. Beyond `memory_limit` (e.g. "4GB"),
+    DuckDB spills intermediates to `temp_directory` (default: db.duckdb.tmp/).
+    Settings left at None keep DuckDB's defaults.
+    """
+    config = {
+        "memory_limit": memory_limit,
+        "threads": threads,
+        "temp_directory": temp_directory,
+    }
+    return duckdb.connect(
+        DB_FILEPATH,
+        config={key: value for key, value in config.items() if value is not None},
+    )
+
+
+def get_results_db(filepath=RESULTS_DB_FILEPATH):
+    return duckdb.connect(filepath)
 
 
 def wrap(text, width):
@@ -127,6 +145,33 @@ def draw_box_plot(
         plt.show()
 
 
+def draw_quartile_box_plot(
+    xs, quartiles, xlabel, ylabel, save_path=None, log_scale_y=False, title=None
+):
+    # Box plots from precomputed [min, q1, median, q3, max], whiskers span min to max
+    fig, ax = plt.subplots()
+    stats = [
+        dict(whislo=q[0], q1=q[1], med=q[2], q3=q[3], whishi=q[4], fliers=[])
+        for q in quartiles
+        if q is not None
+    ]
+    positions = [i + 1 for i, q in enumerate(quartiles) if q is not None]
+    ax.bxp(stats, positions=positions, patch_artist=True)
+    plt.xticks(list(range(1, len(quartiles) + 1)), xs)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.grid()
+    if log_scale_y:
+        ax.set_yscale("log")
+    if title is not None:
+        plt.title("\n".join(wrap(title, 60)))
+    if save_path is not None:
+        plt.savefig(save_path)
+        plt.close()
+    else:
+        plt.show()
+
+
 def draw_bar_plot(
     xs, ys, xlabel, ylabel, save_path=None, log_scale_y=False, title=None
 ):
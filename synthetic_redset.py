@@ -0,0 +1,89 @@
+from src.synthetic_redset import SyntheticRedset, SYNTHETIC_REDSET_DIR_PATH
+import argparse
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="""
+        Generate a synthetic dataset with Redset's schema, e.g. to run the
+        generation pipeline offline (python gen.py --redset <output>) or to
+        load-test it at a multiple of Redset's size.
+    """
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=SYNTHETIC_REDSET_DIR_PATH,
+        help=f"Directory of the generated Parquet files (default: {SYNTHETIC_REDSET_DIR_PATH}).",
+    )
+    parser.add_argument(
+        "--num_users", type=int, default=1000, help="Number of users (default: 1000)."
+    )
+    parser.add_argument(
+        "--num_instances",
+        type=int,
+        default=100,
+        help="Number of clusters the users are spread across (default: 100).",
+    )
+    parser.add_argument(
+        "--queries_per_user",
+        type=int,
+        default=1000,
+        help="Mean number of queries per user, log-normally distributed (default: 1000).",
+    )
+    parser.add_argument(
+        "--repetition",
+        type=float,
+        nargs=2,
+        default=[0.5, 0.5],
+        metavar=("ALPHA", "BETA"),
+        help="Beta distribution of the users' query repetition rates (default: 0.5 0.5).",
+    )
+    parser.add_argument(
+        "--num_joins",
+        type=int,
+        nargs=2,
+        default=[1, 12],
+        metavar=("MIN", "MAX"),
+        help="Range of the number of joins per query (default: 1 12).",
+    )
+    parser.add_argument(
+        "--num_tables_per_user",
+        type=int,
+        default=50,
+        help="Number of distinct tables read by each user (default: 50).",
+    )
+    parser.add_argument(
+        "--num_days",
+        type=int,
+        default=90,
+        help="Number of days spanned by the dataset (default: 90).",
+    )
+    parser.add_argument(
+        "--burstiness",
+        type=float,
+        default=0.5,
+        help="Fraction of each user's queries in their busiest week (default: 0.5).",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the dataset (default: 0)."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    SyntheticRedset(
+        num_users=args.num_users,
+        num_instances=args.num_instances,
+        queries_per_user=args.queries_per_user,
+        repetition_alpha=args.repetition[0],
+        repetition_beta=args.repetition[1],
+        min_num_joins=args.num_joins[0],
+        max_num_joins=args.num_joins[1],
+        num_tables_per_user=args.num_tables_per_user,
+        num_days=args.num_days,
+        burstiness=args.burstiness,
+        seed=args.seed,
+    ).write(args.output)
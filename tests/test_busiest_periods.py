@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import duckdb
+import numpy as np
+import pytest
+from src.redset import Redset, WINDOW_FIRST_START
+
+
+FIRST_START = datetime.fromisoformat(WINDOW_FIRST_START)
+
+
+def create_prefiltered_redset(db, timelines):
+    # `timelines`: user_key -> arrival timestamps
+    # Alternating num_joins, such that no user gets eliminated for a single one
+    rows = [
+        (user_key, query_id, timestamp, 1 + query_id % 2, 2 + query_id % 2)
+        for user_key, timestamps in timelines.items()
+        for query_id, timestamp in enumerate(timestamps)
+    ]
+    db.execute(
+        """
+        CREATE TABLE prefiltered_redset (
+            user_key VARCHAR, query_id BIGINT, arrival_timestamp TIMESTAMP, num_joins BIGINT,
+            num_scans BIGINT, feature_fingerprint VARCHAR, read_table_ids VARCHAR
+        )
+    """
+    )
+    db.executemany(
+        "INSERT INTO prefiltered_redset VALUES (?, ?, ?, ?, ?, 'f', '1,2,3')",
+        rows,
+    )
+
+
+def select_busiest_periods(timelines, window_length, window_stride):
+    db = duckdb.connect()
+    create_prefiltered_redset(db, timelines)
+    Redset(db, window_length=window_length, window_stride=window_stride)._select_busiest_periods()
+    return {
+        user_key: sorted(query_ids)
+        for user_key, query_ids in db.execute(
+            "SELECT user_key, list(query_id) FROM redset GROUP BY user_key"
+        ).fetchall()
+    }
+
+
+def brute_force(timestamps, length, stride):
+    # Every window starting at a stride boundary (or query) before a query
+    starts = sorted(
+        {
+            FIRST_START + (timestamp - FIRST_START) // stride * stride
+            if stride is not None
+            else timestamp
+            for timestamp in timestamps
+        }
+    )
+    counts = [
+        sum(start <= timestamp < start + length for timestamp in timestamps)
+        for start in starts
+    ]
+    start = starts[int(np.argmax(counts))]
+    return sorted(
+        query_id
+        for query_id, timestamp in enumerate(timestamps)
+        if start <= timestamp < start + length
+    )
+
+
+def test_earliest_of_equally_busy_windows():
+    at = lambda hours: FIRST_START + timedelta(hours=hours)
+    timelines = {
+        "busy_later": [at(0), at(0.5), at(5), at(5.1), at(5.2)],
+        "tie": [at(0), at(0.1), at(5), at(5.1)],
+        # Queries at the same time all count
+        "same_time": [at(0), at(2), at(2), at(2)],
+    }
+    assert select_busiest_periods(timelines, "2 HOURS", None) == {
+        "busy_later": [2, 3, 4],
+        "tie": [0, 1],
+        "same_time": [1, 2, 3],
+    }
+
+
+@pytest.mark.parametrize("window_stride", [None, "1 HOUR", "1 DAY"])
+def test_matches_brute_force(window_stride):
+    rng = np.random.default_rng(0)
+    timelines = {
+        f"user_{i}": [
+            # Minutes within two weeks, with repeats
+            FIRST_START + timedelta(minutes=int(minute))
+            for minute in rng.integers(0, 14 * 24 * 60 // rng.integers(1, 50), rng.integers(2, 60))
+        ]
+        for i in range(30)
+    }
+    stride = {None: None, "1 HOUR": timedelta(hours=1), "1 DAY": timedelta(days=1)}
+    expected = {
+        user_key: brute_force(timestamps, timedelta(hours=10), stride[window_stride])
+        for user_key, timestamps in timelines.items()
+    }
+    actual = select_busiest_periods(timelines, "10 HOURS", window_stride)
+    # Users whose busiest window has a single num_joins are eliminated
+    expected = {
+        user_key: query_ids
+        for user_key, query_ids in expected.items()
+        if len({query_id % 2 for query_id in query_ids}) > 1
+    }
+    assert len(expected) > 10
+    assert actual == expected
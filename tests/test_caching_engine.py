@@ -0,0 +1,100 @@
+import duckdb
+from src.engines import CachingEngine, DuckDBEngine, ResultCache
+from src.engines.caching_engine import normalize_sql
+
+
+def fill(cache, sizes):
+    for key, num_bytes in sizes.items():
+        cache.put(key, key, num_bytes, cost_ms=1.0)
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT 1 -- one\nFROM  t;\n") == "SELECT 1 FROM t"
+    assert normalize_sql("select 'a  b'") == "select 'a  b'"
+
+
+def test_normalize_sql_keeps_literals():
+    query = "SELECT *  FROM t WHERE x = 'on-an--antelope-skull' AND y = {}; -- y\n"
+    assert normalize_sql(query.format(1)) == (
+        "SELECT * FROM t WHERE x = 'on-an--antelope-skull' AND y = 1"
+    )
+    assert normalize_sql(query.format(1)) != normalize_sql(query.format(2))
+    assert normalize_sql("SELECT 'it''s -- a' AS \"x--y\"") == "SELECT 'it''s -- a' AS \"x--y\""
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache("lru", max_entries=2)
+    fill(cache, {"a": 1, "b": 1})
+    assert cache.get("a") == "a"
+    fill(cache, {"c": 1})
+    assert set(cache.entries) == {"a", "c"}
+    assert cache.evictions == 1
+
+
+def test_lfu_evicts_least_frequently_used():
+    cache = ResultCache("lfu", max_entries=2)
+    fill(cache, {"a": 1, "b": 1})
+    cache.get("b")
+    cache.get("b")
+    cache.get("a")
+    fill(cache, {"c": 1})
+    assert set(cache.entries) == {"b", "c"}
+
+
+def test_lfu_breaks_ties_by_recency():
+    cache = ResultCache("lfu", max_entries=2)
+    fill(cache, {"a": 1, "b": 1})
+    cache.get("a")
+    cache.get("b")
+    fill(cache, {"c": 1})
+    assert set(cache.entries) == {"b", "c"}
+
+
+def test_size_evicts_largest_first():
+    cache = ResultCache("size", max_bytes=10)
+    fill(cache, {"a": 6, "b": 3})
+    fill(cache, {"c": 4})
+    assert set(cache.entries) == {"b", "c"}
+    assert cache.num_bytes == 7
+
+
+def test_results_larger_than_the_cache_are_not_cached():
+    cache = ResultCache("lru", max_bytes=10)
+    fill(cache, {"a": 5, "b": 11})
+    assert set(cache.entries) == {"a"}
+
+
+def test_stats():
+    cache = ResultCache("lru", max_entries=1)
+    assert cache.get("a") is None
+    cache.put("a", "a", 5, cost_ms=2.0)
+    cache.get("a")
+    cache.get("a")
+    fill(cache, {"b": 3})
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
+    assert cache.time_saved_ms == 4.0
+    # Measured after evicting
+    assert cache.peak_bytes == 5
+    cache.clear()
+    assert cache.entries == {} and cache.num_bytes == 0
+
+
+def test_prepared_statements_are_cached(tmp_path):
+    db_filepath = str(tmp_path / "test.duckdb")
+    db = duckdb.connect(db_filepath)
+    db.execute("CREATE TABLE t AS SELECT range AS x FROM range(10)")
+    db.close()
+
+    engine = CachingEngine(DuckDBEngine(db_filepath=db_filepath), ResultCache("lru"))
+    assert engine.supports_prepare and not engine.supports_profiling
+    con = engine.connect()
+    engine.prepare(con, "q", "SELECT count(*) FROM t;")
+    for _ in range(2):
+        assert engine.fetch(engine.execute_prepared(con, "q")).to_pylist() == [
+            {"count_star()": 10}
+        ]
+    # The same query as a plain statement hits the cache as well
+    engine.run(con, "SELECT count(*)  FROM t")
+    assert (engine.cache.hits, engine.cache.misses) == (2, 1)
+    engine.close(con)
+    assert engine.prepared_keys == dict()
@@ -0,0 +1,53 @@
+from src.benchmarks.join_graph import extract_join_graph
+
+
+def test_job_style_query():
+    join_graph = extract_join_graph(
+        """
+        SELECT MIN(t.title) AS movie_title
+        FROM company_name AS cn, movie_companies AS mc, title AS t
+        WHERE cn.country_code = '[de]'
+          AND cn.id = mc.company_id
+          AND mc.movie_id = t.id;
+    """
+    )
+    assert join_graph == {
+        "tables": ["company_name", "movie_companies", "title"],
+        "join_edges": [
+            "company_name.id = movie_companies.company_id",
+            "movie_companies.movie_id = title.id",
+        ],
+        "predicate_columns": ["company_name.country_code"],
+        "num_joins": 2,
+    }
+
+
+def test_literals_and_between_are_not_split():
+    join_graph = extract_join_graph(
+        """
+        SELECT COUNT(*) FROM title t, movie_info mi
+        WHERE t.id = mi.movie_id
+          AND mi.info = 'a.b AND c.d = e.f'
+          AND t.production_year BETWEEN 1990 AND 2000
+    """
+    )
+    assert join_graph["join_edges"] == ["movie_info.movie_id = title.id"]
+    assert join_graph["predicate_columns"] == ["movie_info.info", "title.production_year"]
+
+
+def test_self_joins_count_per_relation():
+    join_graph = extract_join_graph(
+        """
+        SELECT * FROM title t1, title t2, movie_link ml
+        WHERE t1.id = ml.movie_id AND t2.id = ml.linked_movie_id
+    """
+    )
+    assert join_graph["tables"] == ["movie_link", "title"]
+    assert join_graph["num_joins"] == 2
+
+
+def test_cross_products_are_not_joins():
+    join_graph = extract_join_graph(
+        "SELECT * FROM title t, keyword k, movie_keyword mk WHERE t.id = mk.movie_id"
+    )
+    assert join_graph["num_joins"] == 1
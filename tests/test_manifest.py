@@ -0,0 +1,47 @@
+import duckdb
+import src.manifest as manifest_module
+from src.manifest import Manifest, hash_table
+
+
+def test_outputs_are_up_to_date_until_their_inputs_change(tmp_path):
+    output = str(tmp_path / "workload.sql")
+    open(output, "w").close()
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    assert not manifest.is_up_to_date(output, {"csv": "a"})
+    manifest.record(output, {"csv": "a"})
+    manifest.save()
+
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    assert manifest.is_up_to_date(output, {"csv": "a"})
+    assert not manifest.is_up_to_date(output, {"csv": "b"})
+
+
+def test_missing_files_are_outdated(tmp_path):
+    output = str(tmp_path / "workload.parquet")
+    dictionary = str(tmp_path / "workload.dictionary.parquet")
+    open(output, "w").close()
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.record(output, {"csv": "a"}, [output, dictionary])
+    assert not manifest.is_up_to_date(output, {"csv": "a"})
+    open(dictionary, "w").close()
+    assert manifest.is_up_to_date(output, {"csv": "a"})
+
+
+def test_new_generator_version_outdates_everything(tmp_path, monkeypatch):
+    output = str(tmp_path / "workload.sql")
+    open(output, "w").close()
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.record(output, {"csv": "a"})
+    monkeypatch.setattr(
+        manifest_module, "GENERATOR_VERSION", manifest_module.GENERATOR_VERSION + 1
+    )
+    assert not manifest.is_up_to_date(output, {"csv": "a"})
+
+
+def test_hash_table_ignores_row_order():
+    db = duckdb.connect()
+    db.execute("CREATE TABLE a AS SELECT * FROM (VALUES (1, 'x'), (2, 'y'))")
+    db.execute("CREATE TABLE b AS SELECT * FROM (VALUES (2, 'y'), (1, 'x'))")
+    db.execute("CREATE TABLE c AS SELECT * FROM (VALUES (1, 'x'), (2, 'z'))")
+    assert hash_table(db, "a") == hash_table(db, "b")
+    assert hash_table(db, "a") != hash_table(db, "c")
@@ -0,0 +1,45 @@
+import numpy as np
+from src.packed_workload import PackedWorkload, pack_workload
+
+
+def write_workload(tmp_path, query_names):
+    for name in set(query_names):
+        (tmp_path / f"{name}.sql").write_text(f"SELECT '{name}';\n")
+    csv_filepath = tmp_path / "workload.csv"
+    csv_filepath.write_text(
+        "filepath,num_joins_in_user_query,num_joins_in_benchmark_query,query_id,arrival_timestamp\n"
+        + "".join(
+            f"{tmp_path / name}.sql,{i},{i + 1},{100 + i},2024-03-04 00:00:0{i}\n"
+            for i, name in enumerate(query_names)
+        )
+    )
+    return str(csv_filepath)
+
+
+def test_packed_workload_matches_csv(tmp_path):
+    csv_filepath = write_workload(tmp_path, ["a", "b", "a"])
+    assert pack_workload(csv_filepath) == 3
+    workload = PackedWorkload(str(tmp_path / "workload.arrow"))
+    assert len(workload) == 3
+    assert [query for _, query in workload] == ["SELECT 'a';", "SELECT 'b';", "SELECT 'a';"]
+    # Every distinct query once
+    assert len(workload.queries) == 2
+    assert workload["num_joins_in_user_query"].tolist() == [0, 1, 2]
+    assert workload["query_id"].tolist() == [100, 101, 102]
+    assert workload["arrival_timestamp"][-1] == np.datetime64("2024-03-04T00:00:02")
+
+
+def test_packed_columns_are_views_on_the_mapping(tmp_path):
+    pack_workload(write_workload(tmp_path, ["a", "b"]))
+    workload = PackedWorkload(str(tmp_path / "workload.arrow"))
+    for column in ["query_idx", "num_joins_in_benchmark_query", "query_id", "arrival_timestamp"]:
+        values = workload[column]
+        assert not values.flags.owndata and not values.flags.writeable
+
+
+def test_empty_workload(tmp_path):
+    assert pack_workload(write_workload(tmp_path, [])) == 0
+    workload = PackedWorkload(str(tmp_path / "workload.arrow"))
+    assert len(workload) == 0
+    assert list(workload) == []
+    assert len(workload["query_id"]) == 0
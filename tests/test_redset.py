@@ -0,0 +1,43 @@
+import duckdb
+from src.redset import Redset
+from src.synthetic_redset import SyntheticRedset
+
+
+def write_synthetic_redset(dir_path, num_users, seed=0):
+    SyntheticRedset(
+        num_users=num_users,
+        num_instances=10,
+        queries_per_user=200,
+        start="2024-03-04",
+        num_days=14,
+        seed=seed,
+    ).write(dir_path)
+
+
+def get_num_users(db):
+    return db.execute("SELECT count(DISTINCT user_key) FROM redset").fetchone()[0]
+
+
+def test_regenerated_source_is_reingested(tmp_path):
+    source = str(tmp_path / "synthetic")
+    db = duckdb.connect()
+
+    write_synthetic_redset(source, num_users=20)
+    redset = Redset(db, source=source)
+    redset.setup()
+    redset.compute_stats()
+    num_users = get_num_users(db)
+    assert num_users > 0
+
+    # Without override, an unchanged source isn't ingested again
+    redset.setup()
+    assert get_num_users(db) == num_users
+
+    write_synthetic_redset(source, num_users=60, seed=1)
+    redset.setup()
+    assert get_num_users(db) > num_users
+    # The user stats are recollected on the new Redset
+    redset.compute_stats()
+    assert db.execute(
+        "SELECT count(*) FROM user_stats"
+    ).fetchone()[0] == get_num_users(db)
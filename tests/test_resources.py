@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from src.resources import ResourceSampler
+
+
+class RestartingEngine:
+    """
+    Fake engine whose queries run in a process that gets replaced, like the
+    DuckDB CLI after a timeout.
+    """
+
+    supports_memory_reporting = False
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def get_pid(self, con):
+        return self.pid
+
+
+def test_sampler_follows_restarted_process():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    engine = RestartingEngine(process.pid)
+    sampler = ResourceSampler(engine, None, interval_s=60)
+    sampler.start()
+    sampler.mark("bucket", "type", 0)
+    # The first process is gone, the next one runs the queries
+    engine.pid = os.getpid()
+    sampler.mark("bucket", "type", 1)
+    sampler.stop()
+    samples = {sample["position"]: sample for sample in sampler.samples}
+    assert samples[0]["cpu_time_ms"] is None
+    assert samples[1]["cpu_time_ms"] is not None
@@ -0,0 +1,174 @@
+import threading
+import time
+import duckdb
+import numpy as np
+import pytest
+import src.runner as runner_module
+from src.engines import CachingEngine, DuckDBEngine, ResultCache
+from src.runner import Runner, bootstrap_ci, run_with_timeout
+
+
+class InterruptibleEngine:
+    """
+    Fake engine recording when its queries get interrupted.
+    """
+
+    supports_interrupt = True
+
+    def __init__(self, interrupt_duration_s=0):
+        self.interrupt_duration_s = interrupt_duration_s
+        self.interrupt_started = threading.Event()
+        self.interrupts = []
+
+    def interrupt(self, con):
+        self.interrupt_started.set()
+        time.sleep(self.interrupt_duration_s)
+        self.interrupts.append(con)
+
+
+def test_fast_query_is_ok():
+    engine = InterruptibleEngine()
+    result, _, status, error = run_with_timeout(engine, "con", lambda: [(1,)], 10)
+    assert (result, status, error) == ([(1,)], "ok", None)
+    assert engine.interrupts == []
+
+
+def test_failed_query_is_recorded():
+    def fail():
+        raise RuntimeError("Catalog Error")
+
+    result, _, status, error = run_with_timeout(InterruptibleEngine(), "con", fail, 10)
+    assert (result, status, error) == (None, "error", "Catalog Error")
+
+
+def test_slow_query_is_interrupted():
+    engine = InterruptibleEngine()
+
+    def slow_query():
+        # Returns once interrupted, like an engine cancelling its query
+        assert engine.interrupt_started.wait(10)
+        raise RuntimeError("INTERRUPT Error")
+
+    result, _, status, _ = run_with_timeout(engine, "con", slow_query, 0.01)
+    assert (result, status) == (None, "timeout")
+    assert engine.interrupts == ["con"]
+
+
+def test_interrupt_does_not_outlive_its_query():
+    # The query finishes right when the timer fires: the interrupt must be
+    # over once `run_with_timeout` returns, or it hits the next query
+    engine = InterruptibleEngine(interrupt_duration_s=0.1)
+
+    def query_finishing_at_timeout():
+        assert engine.interrupt_started.wait(10)
+        return []
+
+    _, _, status, _ = run_with_timeout(engine, "con", query_finishing_at_timeout, 0.01)
+    num_interrupts = len(engine.interrupts)
+    time.sleep(0.3)
+    assert len(engine.interrupts) == num_interrupts == 1
+    assert status == "timeout"
+
+
+class PlainEngine:
+    """
+    Fake engine without prepared statements and profiling.
+    """
+
+    name = "plain"
+    supports_prepare = False
+    supports_profiling = False
+
+    def __init__(self):
+        self.num_connections = 0
+
+    def connect(self):
+        self.num_connections += 1
+
+
+@pytest.mark.parametrize("option", ["prepare", "profile"])
+def test_unsupported_options_are_rejected_before_connecting(option):
+    engine = PlainEngine()
+    with pytest.raises(ValueError):
+        Runner(engine).run(**{option: True})
+    assert engine.num_connections == 0
+
+
+def test_bootstrap_ci_contains_the_median():
+    ci_lo, ci_hi = bootstrap_ci([10, 11, 12, 13, 14, 100])
+    assert 10 <= ci_lo <= 12.5 <= ci_hi <= 100
+    assert bootstrap_ci([5, 5, 5]) == (5.0, 5.0)
+
+
+def test_relative_ci_width_ignores_zero_medians():
+    runner = Runner(PlainEngine())
+    runner.trial_results = [
+        {"bucket": bucket, "workload_type": "w", "trial": trial, "latency_ms": latency_ms}
+        for trial in range(3)
+        for bucket, latency_ms in [("cached", 0.0), ("timed", 10.0)]
+    ]
+    assert runner._max_relative_ci_width() == 0.0
+
+
+def create_db_and_workload(tmp_path, num_queries):
+    db_filepath = str(tmp_path / "test.duckdb")
+    db = duckdb.connect(db_filepath)
+    db.execute("CREATE TABLE t AS SELECT range AS x FROM range(10)")
+    db.close()
+    workload_filepath = tmp_path / "workload.sql"
+    workload_filepath.write_text("-- q.sql\nSELECT count(*) FROM t;\n\n" * num_queries)
+    return db_filepath, workload_filepath
+
+
+def test_warm_trials_start_with_an_empty_cache(tmp_path):
+    db_filepath, workload_filepath = create_db_and_workload(tmp_path, num_queries=2)
+
+    engine = CachingEngine(DuckDBEngine(db_filepath=db_filepath), ResultCache("lru"))
+    runner = Runner(engine)
+    runner.run_trials([("b", "w", str(workload_filepath))], repetitions=3)
+    # Every run misses on the first query, and hits on its repeat
+    assert (engine.cache.hits, engine.cache.misses) == (3, 3)
+
+
+def test_target_ci_width_needs_more_than_one_run(tmp_path):
+    db_filepath, workload_filepath = create_db_and_workload(tmp_path, num_queries=1)
+
+    runner = Runner(DuckDBEngine(db_filepath=db_filepath))
+    # Any CI is narrow enough, but not the zero-width one of a single run
+    runner.run_trials(
+        [("b", "w", str(workload_filepath))], repetitions=1, target_ci_width=10.0
+    )
+    assert len({result["trial"] for result in runner.trial_results}) == 3
+
+
+def fake_stream(engine, stream_id, bucket_name, workload_type, filepath, timeout_s=None):
+    # In isolation (stream_id None), every query is answered from a cache
+    latency_ms = 0.0 if stream_id is None else 1.0
+    return [
+        {
+            "stream_id": stream_id,
+            "bucket": bucket_name,
+            "workload_type": workload_type,
+            "latency_ms": latency_ms,
+        }
+    ]
+
+
+def test_slowdown_without_isolated_time_is_nan(monkeypatch):
+    monkeypatch.setattr(runner_module, "_run_stream", fake_stream)
+    engine = PlainEngine()
+    engine.supports_concurrency = True
+    aggregate, stats = Runner(engine).run_concurrent([("b", "w", "workload.sql")], copies=2)
+    assert all(np.isnan(stream["slowdown"]) for stream in stats)
+    assert np.isnan(aggregate["mean_slowdown"])
+    assert np.isnan(aggregate["isolated_qps"])
+
+
+def test_concurrent_streams_in_processes(tmp_path):
+    db_filepath, workload_filepath = create_db_and_workload(tmp_path, num_queries=2)
+    engine = DuckDBEngine(db_filepath=db_filepath)
+    aggregate, stats = Runner(engine).run_concurrent(
+        [("b", "w", str(workload_filepath))], copies=2, use_processes=True
+    )
+    assert aggregate["num_queries"] == 4
+    assert all(stream["slowdown"] > 0 for stream in stats)
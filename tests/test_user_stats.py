@@ -0,0 +1,149 @@
+import duckdb
+import pytest
+from src.redset import Redset
+from src.user_stats import BOX_PLOT_STATS, UserStats
+from src.synthetic_redset import SyntheticRedset
+
+
+# Stats compared exactly, the others up to rounding
+EXACT_STATS = [
+    "total_num_queries",
+    "min_num_joins",
+    "max_num_joins",
+    "num_distinct_num_joins",
+    "total_exec_time",
+    "num_distinct_readsets",
+    "num_distinct_readset_sizes",
+]
+APPROXIMATE_STATS = ["mean_num_joins", "variance_num_joins", "query_repetition_rate"]
+
+
+@pytest.fixture(scope="module")
+def redset_dir_path(tmp_path_factory):
+    dir_path = str(tmp_path_factory.mktemp("redset") / "synthetic")
+    SyntheticRedset(
+        num_users=100,
+        num_instances=10,
+        queries_per_user=300,
+        start="2024-03-04",
+        num_days=14,
+    ).write(dir_path)
+    return dir_path
+
+
+@pytest.fixture
+def db(redset_dir_path):
+    db = duckdb.connect()
+    Redset(db, source=redset_dir_path).setup()
+    return db
+
+
+def get_user_stats(db):
+    rows = db.execute("SELECT * FROM user_stats ORDER BY user_key").fetchdf()
+    return rows.set_index("user_key")
+
+
+def assert_same_user_stats(actual, expected):
+    assert list(actual.index) == list(expected.index)
+    assert (actual[EXACT_STATS] == expected[EXACT_STATS]).all().all()
+    for stat in APPROXIMATE_STATS:
+        assert actual[stat].to_numpy() == pytest.approx(expected[stat].to_numpy())
+
+
+def get_buckets(db):
+    # The users in ranked order, their stats are compared by `assert_same_user_stats`
+    return db.execute(
+        """
+        SELECT bucket, num_users, total_num_queries, total_exec_time,
+            list_transform(users, user -> user.user_key)
+        FROM user_stats_by_bucket
+        ORDER BY bucket
+    """
+    ).fetchall()
+
+
+def get_column_types(db, table_name):
+    return db.execute(f"DESCRIBE {table_name}").fetchall()
+
+
+def test_partitioned_redset_matches_unpartitioned(redset_dir_path):
+    db = duckdb.connect()
+    Redset(db, source=redset_dir_path).setup()
+    partitioned_db = duckdb.connect()
+    Redset(partitioned_db, source=redset_dir_path, num_partitions=3).setup()
+    assert get_column_types(partitioned_db, "redset") == get_column_types(db, "redset")
+    query = "SELECT * FROM redset ORDER BY user_key, query_id"
+    assert partitioned_db.execute(query).fetchall() == db.execute(query).fetchall()
+
+
+def test_partitioned_user_stats_match_unpartitioned(db):
+    UserStats(db).setup(override=True)
+    expected = get_user_stats(db)
+    expected_types = get_column_types(db, "user_stats")
+    UserStats(db, num_partitions=3).setup(override=True)
+    assert get_column_types(db, "user_stats") == expected_types
+    assert_same_user_stats(get_user_stats(db), expected)
+
+
+def test_append_matches_full_recompute(db):
+    # Hold back the later queries of Redset, and append them in two batches
+    db.execute("CREATE TABLE full_redset AS FROM redset")
+    first, second = db.execute(
+        "SELECT quantile_disc(arrival_timestamp, [0.6, 0.8]) FROM redset"
+    ).fetchone()[0]
+    db.execute(f"DELETE FROM redset WHERE arrival_timestamp >= '{first}'")
+    db.execute(
+        f"""
+        CREATE TABLE batch_1 AS FROM full_redset
+        WHERE arrival_timestamp >= '{first}' AND arrival_timestamp < '{second}'
+    """
+    )
+    db.execute(f"CREATE VIEW batch_2 AS FROM full_redset WHERE arrival_timestamp >= '{second}'")
+
+    user_stats = UserStats(db)
+    user_stats.setup(override=True)
+    user_stats.append("batch_1")
+    user_stats.append("batch_2")
+    appended = get_user_stats(db)
+    appended_buckets = get_buckets(db)
+    assert db.execute("SELECT count(*) FROM redset").fetchone() == db.execute(
+        "SELECT count(*) FROM full_redset"
+    ).fetchone()
+
+    user_stats.setup(override=True)
+    assert_same_user_stats(appended, get_user_stats(db))
+    assert appended_buckets == get_buckets(db)
+
+
+def test_failed_append_is_rolled_back(db):
+    user_stats = UserStats(db)
+    user_stats.setup(override=True)
+    before = get_user_stats(db)
+    num_queries = db.execute("SELECT count(*) FROM redset").fetchone()
+    # Lacks the columns of Redset
+    db.execute("CREATE TABLE batch AS SELECT user_key FROM redset")
+    with pytest.raises(duckdb.Error):
+        user_stats.append("batch")
+    assert db.execute("SELECT count(*) FROM redset").fetchone() == num_queries
+    assert get_user_stats(db).equals(before)
+
+
+def test_bucket_quartiles_match_user_stats(db):
+    user_stats = UserStats(db)
+    user_stats.setup(override=True)
+    buckets = user_stats.get_buckets()
+    assert len(buckets) == len(user_stats.bucket_edges) - 1
+    for bucket in buckets:
+        user_keys = [user["user_key"] for user in bucket["users"]]
+        for stat in BOX_PLOT_STATS:
+            if not user_keys:
+                assert bucket[f"{stat}_quartiles"] is None
+                continue
+            expected = db.execute(
+                f"""
+                SELECT quantile_cont({stat}, [0, 0.25, 0.5, 0.75, 1])
+                FROM user_stats WHERE list_contains(?, user_key)
+            """,
+                [user_keys],
+            ).fetchone()[0]
+            assert list(bucket[f"{stat}_quartiles"]) == pytest.approx(expected)